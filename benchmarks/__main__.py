@@ -0,0 +1,222 @@
+"""
+Offline microbenchmarks for the enrichment hot paths.
+
+    python -m benchmarks                     run and compare against the baseline
+    python -m benchmarks --update-baseline   run and store the results as the baseline
+    python -m benchmarks record              record real TMDB fixtures (needs TMDB_API_KEY)
+
+A run fails (exit code 1) when a benchmark's throughput drops, or its peak
+allocation grows, by more than the threshold relative to the baseline, and
+when there is no baseline to compare against. Throughput is compared
+relative to a fixed reference workload timed alongside each benchmark, so
+a baseline recorded on one machine holds on another, and on a busy one.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from dotenv import load_dotenv
+
+from utils import NotionHandler, PropertyEncoder, TMDB_API, TMDBHandler
+
+from . import fixtures
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class FixtureAPI:
+    """Stand-in for TMDB_API that answers from the fixtures."""
+
+    def __init__(self):
+        self.search_response = fixtures.search_multi()
+
+    def search(self, kind, query, **params):
+        return self.search_response
+
+
+def build_benchmarks():
+    """Return {name: zero-argument callable} for every benchmark."""
+    # Without dedupe, repeated calls do the work instead of returning shared results
+    tmdb = TMDBHandler(None, api=FixtureAPI(), dedupe=False)
+    movie = fixtures.movie_franchise()
+    tv = fixtures.tv_long_running()
+    cleaned_movie = tmdb.clean_media_data(movie, "movie")
+    encoder = PropertyEncoder(fixtures.database_schema())
+
+    return {
+        "clean_media_data[movie_franchise]": lambda: tmdb.clean_media_data(
+            movie, "movie"
+        ),
+        "clean_media_data[tv_long_running]": lambda: tmdb.clean_media_data(tv, "tv"),
+        "search_media[search_multi]": lambda: tmdb.search_media("Parasite"),
+        "resolve_title[search_multi]": lambda: tmdb.resolve_title("Parasite"),
+        "notion_payload[movie_franchise]": lambda: NotionHandler._page_payload(
+            cleaned_movie, encoder
+        ),
+    }
+
+
+def reference():
+    """Fixed pure-Python workload that throughput is measured relative to."""
+    counts = {}
+    for i in range(2000):
+        key = str(i % 97)
+        counts[key] = counts.get(key, 0) + len(key)
+    return sorted(counts.items())
+
+
+def _calls_filling(func, seconds):
+    """How many back-to-back calls of func take at least seconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= seconds:
+            return number
+        number *= 2
+
+
+def measure(func, min_time=1.0, batch_time=0.1):
+    """
+    Return the best throughput (calls/s) of func, the same relative to
+    reference(), and the peak allocation of one call.
+
+    func and reference() are timed in alternating short batches for
+    min_time seconds each and the best batch of each counts, so a machine
+    busy for a moment slows both alike or neither.
+    """
+    func()  # warm up
+    reference()
+
+    timed = (func, reference)
+    numbers = [_calls_filling(f, batch_time) for f in timed]
+    best = [float("inf")] * len(timed)
+    for _ in range(max(5, round(min_time / batch_time))):
+        for i, f in enumerate(timed):
+            start = time.perf_counter()
+            for _ in range(numbers[i]):
+                f()
+            best[i] = min(best[i], time.perf_counter() - start)
+    ops_per_sec, reference_ops = (number / t for number, t in zip(numbers, best))
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": ops_per_sec,
+        "relative_speed": ops_per_sec / reference_ops,
+        "peak_alloc_bytes": peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regression messages."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            regressions.append(f"{name}: not in the baseline")
+            continue
+        if result["relative_speed"] < base["relative_speed"] * (1 - threshold):
+            regressions.append(
+                f"{name}: relative speed {result['relative_speed']:.4f} is below "
+                f"baseline {base['relative_speed']:.4f}"
+            )
+        if result["peak_alloc_bytes"] > base["peak_alloc_bytes"] * (1 + threshold):
+            regressions.append(
+                f"{name}: peak allocation {result['peak_alloc_bytes']} B is above "
+                f"baseline {base['peak_alloc_bytes']} B"
+            )
+    return regressions
+
+
+def run(args):
+    benchmarks = build_benchmarks()
+    if args.filter:
+        benchmarks = {k: v for k, v in benchmarks.items() if args.filter in k}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as json_file:
+            baseline = json.load(json_file)
+    elif not args.update_baseline:
+        print(f"No baseline at {args.baseline}; create one with --update-baseline")
+        return 1
+
+    results = {}
+    for name, func in benchmarks.items():
+        results[name] = measure(func, min_time=args.min_time)
+        base = baseline.get(name)
+        change = (
+            f"{results[name]['relative_speed'] / base['relative_speed'] - 1:+.1%}"
+            if base
+            else "new"
+        )
+        print(
+            f"{name:<40} {results[name]['ops_per_sec']:>12.1f} ops/s "
+            f"{results[name]['peak_alloc_bytes']:>12} B peak  ({change})"
+        )
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as json_file:
+            json.dump({**baseline, **results}, json_file, indent=4, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+def record(args):
+    """Record real TMDB responses as fixtures."""
+    load_dotenv()
+    api = TMDB_API(os.getenv("TMDB_API_KEY"))
+    tmdb = TMDBHandler(os.getenv("TMDB_API_KEY"), api=api)
+
+    # Fetched like a sync does, so TV fixtures include their seasons
+    for name, media_type, media_id in fixtures.RECORDED_TITLES:
+        fixtures.save(
+            name, tmdb.fetch_media_details({"media_type": media_type, "id": media_id})
+        )
+        print(f"Recorded {name}")
+
+    fixtures.save("search_multi", api.search("multi", "Parasite"))
+    print("Recorded search_multi")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("command", nargs="?", choices=["run", "record"], default="run")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed relative regression before failing (default 0.2)",
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--filter", help="only run benchmarks containing this text")
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=1.0,
+        help="seconds each benchmark is timed for (default 1.0)",
+    )
+    args = parser.parse_args(argv)
+
+    return record(args) if args.command == "record" else run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Offline TMDB and Notion payloads for the benchmarks.
+
+Recorded responses in benchmarks/fixtures/<name>.json.gz are used when
+present (see ``python -m benchmarks record``). Otherwise a deterministic
+payload with the same shape and size as the real response is generated, so
+the suite always runs without network access or API keys.
+"""
+
+import gzip
+import json
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Titles recorded by ``python -m benchmarks record``: (fixture, media type, TMDB ID)
+RECORDED_TITLES = [
+    ("movie_franchise", "movie", 299534),  # Avengers: Endgame
+    ("tv_long_running", "tv", 456),  # The Simpsons
+]
+
+JOBS = [
+    "Director",
+    "Producer",
+    "Executive Producer",
+    "Screenplay",
+    "Editor",
+    "Visual Effects Artist",
+    "Animator",
+    "Grip",
+    "Stunt Double",
+    "Production Assistant",
+]
+REGIONS = ["US", "GB", "DE", "FR", "JP", "BR", "CA", "AU", "ES", "IT"]
+PROVIDERS = ["Netflix", "Max", "Disney Plus", "Hulu", "Tubi", "Pluto TV", "Peacock"]
+
+
+def _path(name):
+    return os.path.join(FIXTURES_DIR, f"{name}.json.gz")
+
+
+def load(name):
+    """Return the recorded fixture, or None if it hasn't been recorded."""
+    if not os.path.exists(_path(name)):
+        return None
+    with gzip.open(_path(name), "rt") as json_file:
+        return json.load(json_file)
+
+
+def save(name, data):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with gzip.open(_path(name), "wt") as json_file:
+        json.dump(data, json_file)
+
+
+def _credits(rng, crew_size, cast_size):
+    return {
+        "crew": [
+            {
+                "id": i,
+                "name": f"Crew Member {i}",
+                "job": rng.choice(JOBS),
+                "department": "Crew",
+                "known_for_department": "Crew",
+                "profile_path": f"/crew{i}.jpg",
+                "popularity": rng.random() * 10,
+            }
+            for i in range(crew_size)
+        ],
+        "cast": [
+            {
+                "id": i,
+                "name": f"Actor {i}",
+                "character": rng.choice(["Hero", "Villain", "Bystander (uncredited)"]),
+                "known_for_department": rng.choice(["Acting", "Acting", "Crew"]),
+                "order": i,
+                "profile_path": f"/cast{i}.jpg",
+                "popularity": rng.random() * 10,
+            }
+            for i in range(cast_size)
+        ],
+    }
+
+
+def _watch_providers(rng):
+    return {
+        "results": {
+            region: {
+                "link": f"https://www.themoviedb.org/{region}",
+                "flatrate": [
+                    {"provider_name": name, "provider_id": i, "logo_path": "/l.jpg"}
+                    for i, name in enumerate(rng.sample(PROVIDERS, 3))
+                ],
+                "free": [{"provider_name": "Tubi", "provider_id": 73}],
+            }
+            for region in REGIONS
+        }
+    }
+
+
+def _videos(rng, count):
+    return {
+        "results": [
+            {
+                "key": f"video{i}",
+                "site": rng.choice(["YouTube", "Vimeo"]),
+                "type": rng.choice(["Trailer", "Teaser", "Featurette", "Clip"]),
+                "iso_3166_1": rng.choice(REGIONS[:3]),
+                "size": rng.choice([480, 720, 1080, 2160]),
+                "official": rng.random() > 0.5,
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def movie_franchise():
+    """A big-franchise movie with thousands of crew credits."""
+    recorded = load("movie_franchise")
+    if recorded is not None:
+        return recorded
+
+    rng = random.Random(299534)
+    return {
+        "id": 299534,
+        "title": "Franchise Finale",
+        "original_title": "Franchise Finale",
+        "tagline": "Whatever it takes.",
+        "overview": "The epic conclusion. " * 20,
+        "vote_average": 8.254,
+        "runtime": 181,
+        "release_date": "2019-04-24",
+        "status": "Released",
+        "imdb_id": "tt4154796",
+        "original_language": "en",
+        "poster_path": "/poster.jpg",
+        "backdrop_path": "/backdrop.jpg",
+        "genres": [{"id": 12, "name": "Adventure"}, {"id": 878, "name": "Science Fiction"}],
+        "production_countries": [{"iso_3166_1": "US", "name": "United States of America"}],
+        "credits": _credits(rng, crew_size=3500, cast_size=900),
+        "watch/providers": _watch_providers(rng),
+        "videos": _videos(rng, 120),
+        "release_dates": {
+            "results": [
+                {
+                    "iso_3166_1": region,
+                    "release_dates": [
+                        {"certification": rng.choice(["PG-13", "", "12"]), "type": t}
+                        for t in range(1, 7)
+                    ],
+                }
+                for region in REGIONS * 6
+            ]
+        },
+    }
+
+
+def tv_long_running():
+    """A long-running TV show with dozens of seasons and a large crew."""
+    recorded = load("tv_long_running")
+    if recorded is not None:
+        return recorded
+
+    rng = random.Random(456)
+    seasons = 35
+    return {
+        "id": 456,
+        "name": "Long Running Show",
+        "original_name": "Long Running Show",
+        "tagline": "",
+        "overview": "A family in a town. " * 20,
+        "vote_average": 7.99,
+        "episode_run_time": [22],
+        "first_air_date": "1989-12-17",
+        "last_air_date": "2024-05-19",
+        "status": "Returning Series",
+        "original_language": "en",
+        "poster_path": "/poster.jpg",
+        "backdrop_path": "/backdrop.jpg",
+        "number_of_seasons": seasons,
+        "number_of_episodes": seasons * 22,
+        "genres": [{"id": 16, "name": "Animation"}, {"id": 35, "name": "Comedy"}],
+        "production_countries": [{"iso_3166_1": "US", "name": "United States of America"}],
+        "created_by": [{"id": 1, "name": "Creator One"}],
+        "seasons": [
+            {
+                "season_number": n,
+                "episode_count": 22,
+                "air_date": f"{1989 + n}-09-01",
+                "name": f"Season {n}",
+            }
+            for n in range(1, seasons + 1)
+        ],
+        "last_episode_to_air": {
+            "season_number": seasons,
+            "episode_number": 22,
+            "name": "Finale",
+            "air_date": "2024-05-19",
+        },
+        "next_episode_to_air": None,
+        "credits": _credits(rng, crew_size=2500, cast_size=600),
+        "watch/providers": _watch_providers(rng),
+        "videos": _videos(rng, 60),
+        "content_ratings": {
+            "results": [{"iso_3166_1": region, "rating": "TV-PG"} for region in REGIONS]
+        },
+        "external_ids": {"imdb_id": "tt0096697"},
+        # Appended season details, trimmed to the kept episode fields
+        **{
+            f"season/{n}": {
+                "season_number": n,
+                "episodes": [
+                    {
+                        "season_number": n,
+                        "episode_number": e,
+                        "name": f"Episode {e}",
+                        "air_date": f"{1989 + n}-{(e - 1) // 2 + 1:02d}-01",
+                        "runtime": 22,
+                    }
+                    for e in range(1, 23)
+                ],
+            }
+            for n in range(1, seasons + 1)
+        },
+    }
+
+
+def search_multi():
+    """A full page of search/multi results for an ambiguous title."""
+    recorded = load("search_multi")
+    if recorded is not None:
+        return recorded
+
+    rng = random.Random(20)
+    return {
+        "page": 1,
+        "total_pages": 12,
+        "total_results": 231,
+        "results": [
+            {
+                "id": 1000 + i,
+                "media_type": rng.choice(["movie", "tv", "person"]),
+                "title": f"Parasite {i}",
+                "name": f"Parasite {i}",
+                "overview": "Overview. " * 30,
+                "popularity": rng.random() * 100,
+                "release_date": f"{1990 + i}-01-01",
+                "genre_ids": [18, 53],
+                "poster_path": "/poster.jpg",
+            }
+            for i in range(20)
+        ],
+    }
+
+
+def database_schema():
+    """Property schema of a watchlist database with a property for every field."""
+    properties = {
+        "Title": "title",
+        "Type": "select",
+        "Tagline": "rich_text",
+        "TMDB Rating": "number",
+        "Directors": "multi_select",
+        "Producers": "multi_select",
+        "Creators": "multi_select",
+        "Genres": "multi_select",
+        "Runtime": "number",
+        "Streaming": "multi_select",
+        "Watch Free": "multi_select",
+        "Trailer URL": "url",
+        "IMDb URL": "url",
+        "Synopsis": "rich_text",
+        "Release Date": "date",
+        "Cast": "rich_text",
+        "Country of Origin": "select",
+        "Content Rating": "select",
+        "Status": "select",
+        "Original Language": "select",
+        "Original Title": "rich_text",
+        "Episodes": "number",
+        "Seasons": "number",
+        "Episodes per Season": "rich_text",
+        "Aired Episodes": "number",
+        "Last Episode": "rich_text",
+        "Upcoming Episode": "rich_text",
+        "Last Air Date": "date",
+        "Next Air Date": "date",
+    }
+    return {
+        name: {"id": str(i), "name": name, "type": kind}
+        for i, (name, kind) in enumerate(properties.items())
+    }
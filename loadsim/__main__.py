@@ -0,0 +1,150 @@
+"""
+Run a full sync against local TMDB and Notion stand-ins.
+
+    python -m loadsim --rows 50000 --concurrent --notion-rate-limit 3
+
+Starts both stand-in servers, points the real handlers at them, runs
+update_notion_entries (or its concurrent variant) and reports throughput,
+tail latency and API call counts, so concurrency and cache settings can be
+sized without touching the real APIs. Both clients pace themselves to the
+servers' rate limits, as the real ones do; a sync that fails anyway is
+reported with the counts so far and exits 1.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from main import update_notion_entries, update_notion_entries_async
+from utils import NotionHandler, RateLimiter, TMDB_API, TMDBCache, TMDBHandler
+
+from .servers import Faults, NotionServer, TMDBServer
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(name, server):
+    print(f"\n{name}")
+    for (method, route, status), count in sorted(server.stats.counts.items()):
+        print(f"  {method:<6} {route:<16} {status}  {count:>8} call(s)")
+    for route, latencies in sorted(server.stats.latencies.items()):
+        print(
+            f"  {route:<23} p50 {statistics.median(latencies) * 1000:7.1f} ms"
+            f"  p95 {percentile(latencies, 0.95) * 1000:7.1f} ms"
+            f"  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms"
+        )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m loadsim")
+    parser.add_argument("--rows", type=int, default=1000, help="database rows to sync")
+    parser.add_argument("--concurrent", action="store_true")
+    parser.add_argument("--search-concurrency", type=int, default=8)
+    parser.add_argument("--details-concurrency", type=int, default=8)
+    parser.add_argument("--write-concurrency", type=int, default=3)
+    parser.add_argument("--cache", action="store_true", help="use a fresh TMDB cache")
+    parser.add_argument("--tmdb-latency", type=float, default=60.0, help="ms")
+    parser.add_argument("--tmdb-rate-limit", type=float, default=40.0, help="req/s")
+    parser.add_argument("--tmdb-error-rate", type=float, default=0.0)
+    parser.add_argument("--notion-latency", type=float, default=250.0, help="ms")
+    parser.add_argument("--notion-rate-limit", type=float, default=3.0, help="req/s")
+    parser.add_argument("--notion-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    tmdb_server = TMDBServer(
+        Faults(
+            latency_ms=args.tmdb_latency,
+            jitter_ms=args.tmdb_latency / 3,
+            rate_limit=args.tmdb_rate_limit or None,
+            error_rate=args.tmdb_error_rate,
+            seed=args.seed,
+        )
+    ).start()
+    notion_server = NotionServer(
+        Faults(
+            latency_ms=args.notion_latency,
+            jitter_ms=args.notion_latency / 3,
+            rate_limit=args.notion_rate_limit or None,
+            error_rate=args.notion_error_rate,
+            seed=args.seed + 1,
+        ),
+        rows=args.rows,
+    ).start()
+
+    # Buckets of this run only, so runs don't share budgets
+    rate_limit_path = os.path.join(tempfile.mkdtemp(), "rate_limits.sqlite3")
+
+    def limiter(name, rate):
+        return RateLimiter(name, rate, path=rate_limit_path) if rate else None
+
+    notion_handler = NotionHandler(
+        "secret_loadsim",
+        "loadsim-database",
+        write_concurrency=args.write_concurrency,
+        write_rate=args.notion_rate_limit or 1000.0,
+        client_options={"base_url": notion_server.url},
+        schema_dir=None,
+        limiter=limiter("loadsim:notion", args.notion_rate_limit),
+    )
+
+    cache = None
+    if args.cache:
+        cache = TMDBCache(os.path.join(tempfile.mkdtemp(), "loadsim.sqlite3"))
+    tmdb_handler = TMDBHandler(
+        "loadsim.tmdb.token",
+        cache=cache,
+        api=TMDB_API(
+            "loadsim.tmdb.token",
+            base_url=f"{tmdb_server.url}/3/",
+            limiter=limiter("loadsim:tmdb", args.tmdb_rate_limit),
+        ),
+    )
+
+    error = None
+    started = time.perf_counter()
+    try:
+        if args.concurrent:
+            update_notion_entries_async(
+                notion_handler,
+                tmdb_handler,
+                search_limit=args.search_concurrency,
+                details_limit=args.details_concurrency,
+            )
+        else:
+            update_notion_entries(notion_handler, tmdb_handler)
+    except Exception as e:
+        error = e
+    elapsed = time.perf_counter() - started
+
+    tmdb_server.stop()
+    notion_server.stop()
+
+    if error is None:
+        print(
+            f"Synced {args.rows} row(s) in {elapsed:.1f}s ({args.rows / elapsed:.1f}/s)"
+        )
+    else:
+        print(f"Sync failed after {elapsed:.1f}s: {error!r}")
+    counts = notion_handler.write_counts
+    print(
+        f"Notion pages: {counts['written']} written, "
+        f"{counts['skipped']} skipped, {counts['failed']} failed"
+    )
+    report("TMDB", tmdb_server)
+    report("Notion", notion_server)
+    return 0 if error is None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
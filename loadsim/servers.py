@@ -0,0 +1,365 @@
+"""
+Local stand-ins for the TMDB and Notion endpoints used by the handlers.
+
+Each server injects configurable latency, rate limiting (429 with
+Retry-After) and random server errors, and keeps per-route call counts and
+latencies for the load report.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+class Faults:
+    """Latency, rate limit and error settings of a stand-in server."""
+
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 20.0,
+        rate_limit: float | None = None,
+        error_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        """
+        :param latency_ms: Mean time each request takes.
+        :param jitter_ms: Standard deviation of that time.
+        :param rate_limit: Requests per second allowed before answering 429.
+        :param error_rate: Fraction of requests answered with a 500.
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit or 0.0
+        self._refilled = time.monotonic()
+
+    def delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.gauss(0, self.jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def take_token(self) -> float | None:
+        """Return None if the request is allowed, else the seconds to retry after."""
+        if not self.rate_limit:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit
+            )
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate_limit
+
+    def fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+
+class Stats:
+    """Call counts and latencies per (method, route, status)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counts: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, method: str, route: str, status: int, seconds: float) -> None:
+        with self._lock:
+            self.counts[(method, route, status)] += 1
+            self.latencies[f"{method} {route}"].append(seconds)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # (method, route name, pattern) checked in order; subclasses fill this in
+    routes: List[Tuple[str, str, "re.Pattern[str]"]] = []
+
+    def __init__(self, faults: Faults, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _RequestHandler)
+        self.faults = faults
+        self.stats = Stats()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def error_body(self, status: int) -> Dict[str, Any]:
+        return {"status": status, "message": "Stand-in server error"}
+
+    def handle_route(self, route: str, match, query, body) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandInServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        started = time.perf_counter()
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+        route, match = "unknown", None
+        for method, name, pattern in self.server.routes:
+            match = pattern.fullmatch(parsed.path)
+            if method == self.command and match:
+                route = name
+                break
+
+        faults = self.server.faults
+        time.sleep(faults.delay())
+        headers = {}
+
+        retry_after = faults.take_token()
+        if match is None:
+            status, payload = 404, self.server.error_body(404)
+        elif retry_after is not None:
+            status, payload = 429, self.server.error_body(429)
+            headers["Retry-After"] = f"{retry_after:.3f}"
+        elif faults.fail():
+            status, payload = 500, self.server.error_body(500)
+        else:
+            status, payload = 200, self.server.handle_route(route, match, query, body)
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+        self.server.stats.record(
+            self.command, route, status, time.perf_counter() - started
+        )
+
+    do_GET = do_POST = do_PATCH = _handle
+
+
+class TMDBServer(StandInServer):
+    """Serves search/multi, movie and TV details, change feeds and authentication."""
+
+    routes = [
+        ("GET", "authentication", re.compile(r"/3/authentication")),
+        ("GET", "search", re.compile(r"/3/search/(multi|movie|tv)")),
+        ("GET", "changes", re.compile(r"/3/(movie|tv)/changes")),
+        ("GET", "details", re.compile(r"/3/(movie|tv)/(\d+)")),
+    ]
+
+    def __init__(
+        self, faults: Faults, details_template=None, tv_share: float = 0.3, port=0
+    ) -> None:
+        """
+        :param details_template: Function of (media type, ID) returning a
+            details payload; defaults to a compact synthetic one.
+        :param tv_share: Fraction of titles that resolve to TV shows.
+        """
+        super().__init__(faults, port)
+        self.details_template = details_template or compact_details
+        self.tv_share = tv_share
+
+    def error_body(self, status):
+        return {"success": False, "status_code": status, "status_message": "Error"}
+
+    def handle_route(self, route, match, query, body):
+        if route == "authentication":
+            return {"success": True}
+
+        if route == "search":
+            title = query.get("query", "")
+            media_id = zlib.crc32(title.encode()) % 1_000_000
+            media_type = match.group(1)
+            if media_type == "multi":
+                media_type = "tv" if (media_id % 100) < self.tv_share * 100 else "movie"
+            return {
+                "page": 1,
+                "total_pages": 1,
+                "total_results": 1,
+                "results": [
+                    {
+                        "id": media_id,
+                        "media_type": media_type,
+                        "title": title,
+                        "name": title,
+                        "popularity": 10.0,
+                    }
+                ],
+            }
+
+        if route == "changes":
+            return {"results": [], "page": 1, "total_pages": 1}
+
+        return self.details_template(match.group(1), int(match.group(2)))
+
+
+# Properties of the stand-in database, one of each type the encoder writes
+DATABASE_PROPERTIES = [
+    ("Title", "title"),
+    ("Type", "select"),
+    ("Synopsis", "rich_text"),
+    ("TMDB Rating", "number"),
+    ("Genres", "multi_select"),
+    ("Directors", "multi_select"),
+    ("Cast", "rich_text"),
+    ("Runtime", "number"),
+    ("Release Date", "date"),
+    ("Trailer URL", "url"),
+    ("Status", "select"),
+]
+
+
+class NotionServer(StandInServer):
+    """Serves a database of semicolon-terminated rows and page updates."""
+
+    routes = [
+        ("GET", "databases.retrieve", re.compile(r"/v1/databases/([\w-]+)")),
+        ("POST", "databases.query", re.compile(r"/v1/databases/([\w-]+)/query")),
+        ("PATCH", "pages.update", re.compile(r"/v1/pages/([\w-]+)")),
+    ]
+
+    def __init__(self, faults: Faults, rows: int = 1000, port=0) -> None:
+        super().__init__(faults, port)
+        self.rows = rows
+
+    def error_body(self, status):
+        codes = {429: "rate_limited", 404: "object_not_found"}
+        return {
+            "object": "error",
+            "status": status,
+            "code": codes.get(status, "internal_server_error"),
+            "message": "Stand-in server error",
+        }
+
+    def handle_route(self, route, match, query, body):
+        if route == "pages.update":
+            return {"object": "page", "id": match.group(1)}
+
+        if route == "databases.retrieve":
+            return {
+                "object": "database",
+                "id": match.group(1),
+                "properties": {
+                    name: {"id": name.lower(), "name": name, "type": kind}
+                    for name, kind in DATABASE_PROPERTIES
+                },
+            }
+
+        start = int(body.get("start_cursor") or 0)
+        end = min(start + int(body.get("page_size", 100)), self.rows)
+        return {
+            "object": "list",
+            "results": [
+                {
+                    "object": "page",
+                    "id": f"00000000-0000-0000-0000-{i:012d}",
+                    "properties": {
+                        "Title": {
+                            "id": "title",
+                            "type": "title",
+                            "title": [{"plain_text": f"Title {i};"}],
+                        }
+                    },
+                }
+                for i in range(start, end)
+            ],
+            "has_more": end < self.rows,
+            "next_cursor": str(end) if end < self.rows else None,
+        }
+
+
+def compact_details(media_type: str, media_id: int) -> Dict[str, Any]:
+    """A details payload with the fields the cleaner reads, at a modest size."""
+    rng = random.Random(media_id)
+    details = {
+        "id": media_id,
+        "overview": "An overview. " * 10,
+        "tagline": "A tagline.",
+        "vote_average": rng.random() * 10,
+        "genres": [{"id": 18, "name": "Drama"}],
+        "status": "Released",
+        "original_language": "en",
+        "poster_path": "/poster.jpg",
+        "backdrop_path": "/backdrop.jpg",
+        "production_countries": [{"iso_3166_1": "US", "name": "United States"}],
+        "credits": {
+            "crew": [
+                {"job": rng.choice(["Director", "Producer", "Editor"]), "name": f"C{i}"}
+                for i in range(40)
+            ],
+            "cast": [
+                {"known_for_department": "Acting", "character": "X", "name": f"A{i}"}
+                for i in range(30)
+            ],
+        },
+        "watch/providers": {
+            "results": {"US": {"flatrate": [{"provider_name": "Netflix"}]}}
+        },
+        "videos": {
+            "results": [
+                {
+                    "type": "Trailer",
+                    "site": "YouTube",
+                    "iso_3166_1": "US",
+                    "size": 1080,
+                    "key": "abc",
+                }
+            ]
+        },
+    }
+    if media_type == "movie":
+        details.update(
+            title=f"Movie {media_id}",
+            original_title=f"Movie {media_id}",
+            runtime=120,
+            release_date="2020-01-01",
+            imdb_id=f"tt{media_id:07d}",
+            release_dates={
+                "results": [
+                    {"iso_3166_1": "US", "release_dates": [{"certification": "R"}]}
+                ]
+            },
+        )
+    else:
+        details.update(
+            name=f"Show {media_id}",
+            original_name=f"Show {media_id}",
+            episode_run_time=[45],
+            first_air_date="2020-01-01",
+            number_of_seasons=3,
+            number_of_episodes=30,
+            created_by=[{"name": "Creator"}],
+            content_ratings={"results": [{"iso_3166_1": "US", "rating": "TV-14"}]},
+            external_ids={"imdb_id": f"tt{media_id:07d}"},
+        )
+    return details
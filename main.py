@@ -1,53 +1,469 @@
+import argparse
+import asyncio
 import json
+import logging
 import os
-from pprint import pp
+import signal
+import sys
+import threading
+import time
+from functools import lru_cache
 
 from dotenv import load_dotenv
 
 from results_exceptions import NoEntriesFoundException
-from utils import NotionHandler, TMDBHandler
+from utils import (
+    METRICS,
+    AsyncPipeline,
+    IncrementalRefresh,
+    MultiDatabaseSync,
+    NotionHandler,
+    RateLimiter,
+    RecordExport,
+    ReferenceData,
+    RunJournal,
+    SyncState,
+    TitleIndex,
+    TMDB_API,
+    TMDBCache,
+    TMDBHandler,
+    WatchDaemon,
+    WorkScheduler,
+    load_shards,
+    open_exporter,
+)
+from utils.LoggingSetup import configure_logging
+from utils.Metrics import ITEMS_PER_SECOND
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Constants
-NOTION_API_KEY = os.getenv("NOTION_API_KEY")
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-DATABASE_ID = os.getenv("DATABASE_ID")
 
-# Language codes
-with open("utils/iso_639_1_languages.json", "r") as json_file:
-    iso_639_1_languages = json.load(json_file)
+def update_notion_entries(notion_handler, tmdb_handler, sync_state=None, journal=None):
+    found_entries = 0
+    started = time.perf_counter()
+    if journal:
+        notion_handler.write_queue.listeners.append(journal.on_write)
 
-# Initialize Notion client and TMDB API
-notion = NotionHandler(NOTION_API_KEY, DATABASE_ID)
-tmdb = TMDBHandler(TMDB_API_KEY)
+    try:
+        for entry in notion_handler.iter_entries_to_update():
+            found_entries += 1
+            update_notion_entry(entry, notion_handler, tmdb_handler, sync_state, journal)
+    finally:
+        # Writes already queued are sent even when the run is cut short
+        for write_result in notion_handler.flush_updates().values():
+            if not write_result.success:
+                logger.error(
+                    "Writing page %s failed: %s",
+                    write_result.page_id,
+                    write_result.error,
+                )
+        if sync_state:
+            sync_state.save()
 
+    if not found_entries:
+        raise NoEntriesFoundException("No entries found in Notion.")
+
+    ITEMS_PER_SECOND.set(found_entries / (time.perf_counter() - started))
+    finish_journal(journal, notion_handler)
+
+
+def update_notion_entry(entry, notion_handler, tmdb_handler, sync_state, journal):
+    """Enrich one entry and queue its write; a failure only costs this entry."""
+    title = entry["properties"]["Title"]["title"][0]["plain_text"].rstrip(";")
+    page_id = entry["id"]
 
-def update_notion_entries(notion_handler, tmdb_handler):
-    notion_entries = notion_handler.get_entries_to_update()
+    # Pick up where an interrupted run left the page, if it did
+    checkpoint = journal.get(page_id, title) if journal else None
+    tmdb_result = checkpoint.tmdb_result if checkpoint else None
+    cleaned_data = checkpoint.cleaned if checkpoint else None
 
-    if not notion_entries:
+    # Search TMDb and handle multiple results if needed
+    try:
+        if tmdb_result is None:
+            tmdb_result = tmdb_handler.resolve_title(title)
+            if journal:
+                journal.record(page_id, "resolved", title=title, tmdb_result=tmdb_result)
+        if cleaned_data is None:
+            cleaned_data = tmdb_handler.fetch_cleaned(tmdb_result)
+            if journal:
+                journal.record(page_id, "cleaned", cleaned=cleaned_data)
+        logger.debug("%s: %s", title, dict(cleaned_data))
+        if not (checkpoint and checkpoint.stage == "written"):
+            notion_handler.queue_update(page_id, cleaned_data, marked=True)
+        if sync_state:
+            sync_state.link(page_id, tmdb_result)
+    except ValueError as e:
+        logger.error("%s: %s", title, e)
+    except Exception as e:
+        # A request that failed for good costs this entry, not the run
+        logger.error("%s: %s", title, e, exc_info=e)
+
+
+def update_notion_entries_async(
+    notion_handler,
+    tmdb_handler,
+    sync_state=None,
+    search_limit=8,
+    details_limit=8,
+    journal=None,
+):
+    """Same as update_notion_entries, but overlaps the network calls of entries."""
+    pipeline = AsyncPipeline(
+        notion_handler,
+        tmdb_handler,
+        search_limit=search_limit,
+        details_limit=details_limit,
+        sync_state=sync_state,
+        journal=journal,
+    )
+    results = asyncio.run(pipeline.run(notion_handler.iter_entries_to_update()))
+
+    if not results:
         raise NoEntriesFoundException("No entries found in Notion.")
 
-    for entry in notion_entries:
+    if sync_state:
+        sync_state.save()
+    finish_journal(journal, notion_handler)
+
+    return results
+
+
+def finish_journal(journal, notion_handler):
+    """Start the next run afresh if every write went through, else keep the journal."""
+    if journal is None:
+        return
+    if notion_handler.write_counts["failed"]:
+        journal.sync()
+        print("Some writes failed; run sync again to resume from the journal")
+    else:
+        journal.clear()
+
+
+def refresh_notion_entries(notion_handler, tmdb_handler, sync_state):
+    """Re-fetch only the linked entries whose TMDB data changed since the last sync."""
+    return IncrementalRefresh(notion_handler, tmdb_handler, sync_state).run()
+
+
+# Clients are built on first use, so only the ones a command needs are created
+
+
+@lru_cache(maxsize=None)
+def get_notion_handler():
+    return NotionHandler(
+        os.getenv("NOTION_API_KEY"),
+        os.getenv("DATABASE_ID"),
+        write_concurrency=int(os.getenv("NOTION_WRITE_CONCURRENCY", 3)),
+        state=get_sync_state(),
+        limiter=get_rate_limiter(
+            "notion:NOTION_API_KEY", float(os.getenv("NOTION_RATE_LIMIT", 3))
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_tmdb_cache():
+    return TMDBCache(
+        os.getenv("TMDB_CACHE_PATH", "cache/tmdb_cache.sqlite3"),
+        bypass=os.getenv("TMDB_CACHE_BYPASS", "") == "1",
+        refresh=os.getenv("TMDB_CACHE_REFRESH", "") == "1",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_title_index():
+    # Empty until "python main.py index" has downloaded the exports
+    return TitleIndex(os.getenv("TITLE_INDEX_DIR", "cache/title_index"))
+
+
+@lru_cache(maxsize=None)
+def get_tmdb_handler():
+    api = TMDB_API(
+        os.getenv("TMDB_API_KEY"),
+        limiter=get_rate_limiter("tmdb", float(os.getenv("TMDB_RATE_LIMIT", 40))),
+    )
+    return TMDBHandler(
+        os.getenv("TMDB_API_KEY"),
+        cache=get_tmdb_cache(),
+        api=api,
+        title_index=get_title_index(),
+        reference=ReferenceData(api, get_tmdb_cache()),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(name, rate):
+    # Buckets shared with every other process using the same file
+    return RateLimiter(name, rate, path=get_rate_limit_path())
+
+
+def get_rate_limit_path():
+    return os.getenv("RATE_LIMIT_PATH", "state/rate_limits.sqlite3")
+
+
+@lru_cache(maxsize=None)
+def get_run_journal():
+    # Checkpoints of an interrupted sync, resumed by the next one
+    return RunJournal(os.getenv("RUN_JOURNAL_PATH", "state/run_journal.jsonl"))
+
+
+@lru_cache(maxsize=None)
+def get_sync_state():
+    # Last-sync watermark, page-to-TMDB links and digests of written values
+    return SyncState(os.getenv("SYNC_STATE_PATH", "state/sync_state.sqlite3"))
+
+
+def print_write_counts(notion_handler):
+    counts = notion_handler.write_counts
+    print(
+        f"Notion pages: {counts['written']} written, "
+        f"{counts['skipped']} skipped as unchanged, {counts['failed']} failed"
+    )
+
+
+def run_sync(args):
+    journal = get_run_journal()
+    if args.fresh:
+        journal.clear()
+
+    if args.concurrent:
+        update_notion_entries_async(
+            get_notion_handler(),
+            get_tmdb_handler(),
+            get_sync_state(),
+            search_limit=args.search_concurrency,
+            details_limit=args.details_concurrency,
+            journal=journal,
+        )
+    else:
+        update_notion_entries(
+            get_notion_handler(), get_tmdb_handler(), get_sync_state(), journal
+        )
+    print_write_counts(get_notion_handler())
+
+
+def run_sync_all(args):
+    shards = load_shards(args.config, rate_limit_path=get_rate_limit_path())
+    counts = MultiDatabaseSync(shards, get_tmdb_handler(), workers=args.workers).run()
+    print(json.dumps(counts, indent=4))
+
+
+def run_refresh(args):
+    refreshed = refresh_notion_entries(
+        get_notion_handler(), get_tmdb_handler(), get_sync_state()
+    )
+    print(json.dumps(refreshed))
+    print_write_counts(get_notion_handler())
+
+
+def run_watch(args):
+    scheduler = WorkScheduler(workers=args.workers)
+    daemon = WatchDaemon(
+        get_notion_handler(),
+        get_tmdb_handler(),
+        get_sync_state(),
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        scheduler=scheduler,
+        refresh_interval=args.refresh_interval,
+    )
+
+    # Finish the current poll and exit cleanly on Ctrl+C or SIGTERM
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    daemon.run(stop)
+    scheduler.shutdown()
+    print_write_counts(get_notion_handler())
+
+
+def iter_export_titles(args):
+    """(page ID, title) pairs from a titles file, or the Notion entries to update."""
+    if args.titles:
+        with open(args.titles, "r", encoding="utf-8") as titles_file:
+            for line in titles_file:
+                if line.strip():
+                    yield None, line.strip()
+        return
+
+    for entry in get_notion_handler().iter_entries_to_update():
         title = entry["properties"]["Title"]["title"][0]["plain_text"].rstrip(";")
-        page_id = entry["id"]
+        yield entry["id"], title
+
+
+def run_export(args):
+    export = RecordExport(
+        get_tmdb_handler(), open_exporter(args.output), workers=args.workers
+    )
+    print(json.dumps(export.run(iter_export_titles(args))))
+
+
+def run_lookup(args):
+    tmdb_handler = get_tmdb_handler()
+    print(json.dumps(dict(tmdb_handler.get_cleaned_media_data(args.title)), indent=4))
+
+
+def run_index(args):
+    rebuilt = get_title_index().refresh()
+    print(json.dumps({"rebuilt": rebuilt, "exports": get_title_index().meta}))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Fill in Notion watchlist entries with data from TMDB."
+    )
+    parser.add_argument(
+        "--skip-key-check",
+        action="store_true",
+        help="don't verify the TMDB API key before running",
+    )
+    parser.add_argument(
+        "--log-level",
+        default=os.getenv("LOG_LEVEL", "INFO"),
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="level written to logs/notion.jsonl (default INFO)",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        default=os.getenv("METRICS_TEXTFILE"),
+        help="write metrics here at the end of the run (node exporter textfile)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.getenv("METRICS_PORT", 0)) or None,
+        help="serve metrics over HTTP on this port while running",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync = subparsers.add_parser(
+        "sync", help="fill in entries whose titles end in a semicolon"
+    )
+    sync.add_argument(
+        "--concurrent",
+        action="store_true",
+        help="overlap the network calls of entries",
+    )
+    sync.add_argument(
+        "--search-concurrency",
+        type=int,
+        default=int(os.getenv("TMDB_SEARCH_CONCURRENCY", 8)),
+        help="TMDB searches in flight at once (with --concurrent)",
+    )
+    sync.add_argument(
+        "--details-concurrency",
+        type=int,
+        default=int(os.getenv("TMDB_DETAILS_CONCURRENCY", 8)),
+        help="TMDB detail fetches in flight at once (with --concurrent)",
+    )
+    sync.add_argument(
+        "--fresh",
+        action="store_true",
+        help="ignore the journal of an interrupted run and start over",
+    )
+    sync.set_defaults(func=run_sync)
+
+    sync_all = subparsers.add_parser(
+        "sync-all", help="sync every database listed in a config file"
+    )
+    sync_all.add_argument(
+        "--config",
+        default=os.getenv("SYNC_CONFIG", "databases.json"),
+        help="JSON file listing the databases (default databases.json)",
+    )
+    sync_all.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("SYNC_WORKERS", 8)),
+        help="entries processed at once across all databases",
+    )
+    sync_all.set_defaults(func=run_sync_all)
+
+    watch = subparsers.add_parser(
+        "watch", help="keep running and fill in new entries as they are added"
+    )
+    watch.add_argument(
+        "--min-interval",
+        type=float,
+        default=float(os.getenv("WATCH_MIN_INTERVAL", 2)),
+        help="seconds between polls while entries are coming in (default 2)",
+    )
+    watch.add_argument(
+        "--max-interval",
+        type=float,
+        default=float(os.getenv("WATCH_MAX_INTERVAL", 15)),
+        help="seconds between polls once the database is idle (default 15)",
+    )
+    watch.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WATCH_WORKERS", 8)),
+        help="entries and refreshed pages processed at once (default 8)",
+    )
+    watch.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=float(os.getenv("WATCH_REFRESH_INTERVAL", 0)) or None,
+        help="also refresh changed synced entries every this many seconds, "
+        "behind new entries",
+    )
+    watch.set_defaults(func=run_watch)
+
+    refresh = subparsers.add_parser(
+        "refresh", help="update synced entries that changed on TMDB"
+    )
+    refresh.set_defaults(func=run_refresh)
+
+    lookup = subparsers.add_parser(
+        "lookup", help="print the cleaned TMDB data for a title"
+    )
+    lookup.add_argument("title")
+    lookup.set_defaults(func=run_lookup)
+
+    export = subparsers.add_parser(
+        "export", help="write enriched records to a JSONL or Parquet file"
+    )
+    export.add_argument(
+        "output", help="file to write; .parquet for Parquet, .jsonl or .jsonl.gz otherwise"
+    )
+    export.add_argument(
+        "--titles",
+        help="file with one title per line (default: the Notion entries to update)",
+    )
+    export.add_argument(
+        "--workers", type=int, default=8, help="titles enriched at once (default 8)"
+    )
+    export.set_defaults(func=run_export)
+
+    index = subparsers.add_parser(
+        "index", help="update the local title index from TMDB's daily exports"
+    )
+    index.set_defaults(func=run_index, skip_key_check=True)
+
+    return parser
+
 
-        # Search TMDb and handle multiple results if needed
-        try:
-            cleaned_data = tmdb_handler.get_cleaned_media_data(title=title)
-            pp(cleaned_data)
-        except ValueError as e:
-            print(f"Error: {e}")
+def main(argv=None):
+    # Load environment variables from .env file
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    configure_logging(level=getattr(logging, args.log_level))
 
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
 
-# update_notion_entries(notion, tmdb)
+    try:
+        if not args.skip_key_check:
+            get_tmdb_handler().verify_api_key()
+        args.func(args)
+    except NoEntriesFoundException as e:
+        print(e)
+        return 1
+    finally:
+        if args.metrics_textfile:
+            METRICS.write_textfile(args.metrics_textfile)
 
-results = tmdb.search_media("The Dark Knight")
-result = results[0]
-tmdb_data = tmdb.fetch_media_details(result)
-print(json.dumps(tmdb.clean_media_data(tmdb_data, "movie"), indent=4))
+    return 0
 
 
-# raw_data = tmdb.fetch_media_details()
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,3 +2,15 @@ class NoEntriesFoundException(Exception):
     """Exception raised when no entries are returned from a query."""
 
     pass
+
+
+class LowConfidenceMatchException(ValueError):
+    """Exception raised when no search result matches a title closely enough."""
+
+    pass
+
+
+class DeadlineExceededException(Exception):
+    """Exception raised when scheduled work was not started before its deadline."""
+
+    pass
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Tuple
+
+from .Metrics import COALESCED_CALLS, ITEMS_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPipeline:
+    """
+    Enrich Notion entries concurrently.
+
+    Each entry goes through the same steps as the sequential path (search,
+    fetch details, clean, write), but entries overlap with one another. TMDB
+    searches and detail fetches each get their own in-flight limit, while
+    writes go to the Notion handler's write-behind queue, which has its own
+    workers and rate-limit pacing.
+    """
+
+    def __init__(
+        self,
+        notion_handler,
+        tmdb_handler,
+        search_limit: int = 8,
+        details_limit: int = 8,
+        sync_state=None,
+        journal=None,
+    ) -> None:
+        """
+        :param journal: RunJournal to checkpoint entries in and resume them from.
+        """
+        self.notion_handler = notion_handler
+        self.tmdb_handler = tmdb_handler
+        self.search_limit = search_limit
+        self.details_limit = details_limit
+        self.sync_state = sync_state
+        self.journal = journal
+
+    async def run(self, entries: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Process all entries and return a mapping of page ID to cleaned data.
+        Entries that fail, for want of a match or on a request error, are
+        reported and mapped to None. Queued writes are flushed even if the
+        run itself fails, e.g. when the Notion query breaks off.
+
+        Entries are pulled from the iterable lazily, so a streaming query can
+        feed the pipeline without ever being held in memory all at once.
+        """
+        # The handlers are blocking, so give the pool one thread per slot
+        # plus one for pulling entries off the (possibly blocking) iterable
+        workers = self.search_limit + self.details_limit + 1
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pipeline"
+        )
+        self._search_slots = asyncio.Semaphore(self.search_limit)
+        self._details_slots = asyncio.Semaphore(self.details_limit)
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+
+        # Keep enough entries queued to saturate every stage, but no more
+        max_pending = 2 * (workers - 1)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        if self.journal:
+            self.notion_handler.write_queue.listeners.append(self.journal.on_write)
+        iterator = iter(entries)
+        results: Dict[str, Any] = {}
+        pending = set()
+
+        try:
+            while True:
+                entry = await loop.run_in_executor(self._executor, next, iterator, None)
+                if entry is None:
+                    break
+
+                pending.add(asyncio.ensure_future(self._process_entry(entry)))
+                if len(pending) >= max_pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    results.update(task.result() for task in done)
+
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                results.update(task.result() for task in done)
+        except Exception:
+            # Entries already under way still finish, and get written below
+            if pending:
+                await asyncio.wait(pending)
+                pending = set()
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            try:
+                write_results = await loop.run_in_executor(
+                    self._executor, self.notion_handler.flush_updates
+                )
+            finally:
+                self._executor.shutdown(wait=True)
+
+        for write_result in write_results.values():
+            if not write_result.success:
+                logger.error(
+                    "Writing page %s failed: %s",
+                    write_result.page_id,
+                    write_result.error,
+                )
+
+        ITEMS_PER_SECOND.set(len(results) / (time.perf_counter() - started))
+        return results
+
+    async def _call(self, slots: asyncio.Semaphore, func, *args):
+        """Run a blocking handler call in the pool once a slot is free."""
+        async with slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _call_once(self, key: Tuple, slots: asyncio.Semaphore, func, *args):
+        """
+        Like _call, but entries asking for the same key while it is in flight
+        await the one call instead of each holding a slot and a thread.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(slots, func, *args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            COALESCED_CALLS.inc(call=key[0])
+        return await task
+
+    async def _process_entry(self, entry: Dict[str, Any]) -> Tuple[str, Any]:
+        title = entry["properties"]["Title"]["title"][0]["plain_text"].rstrip(";")
+        page_id = entry["id"]
+
+        journal = self.journal
+        checkpoint = journal.get(page_id, title) if journal else None
+        tmdb_result = checkpoint.tmdb_result if checkpoint else None
+        cleaned_data = checkpoint.cleaned if checkpoint else None
+
+        try:
+            if tmdb_result is None:
+                tmdb_result = await self._call_once(
+                    ("resolve", self.tmdb_handler.title_key(title)),
+                    self._search_slots,
+                    self.tmdb_handler.resolve_title,
+                    title,
+                )
+                if journal:
+                    journal.record(
+                        page_id, "resolved", title=title, tmdb_result=tmdb_result
+                    )
+            media_type = tmdb_result.get("media_type")
+
+            if cleaned_data is None:
+                cleaned_data = await self._call_once(
+                    ("details", media_type, tmdb_result.get("id")),
+                    self._details_slots,
+                    self.tmdb_handler.fetch_cleaned,
+                    tmdb_result,
+                )
+                if journal:
+                    journal.record(page_id, "cleaned", cleaned=cleaned_data)
+
+            if not (checkpoint and checkpoint.stage == "written"):
+                self.notion_handler.queue_update(page_id, cleaned_data, marked=True)
+            if self.sync_state:
+                self.sync_state.link(page_id, tmdb_result)
+            return page_id, cleaned_data
+
+        except ValueError as e:
+            logger.error("%s: %s", title, e)
+            return page_id, None
+        except Exception as e:
+            # A request that failed for good costs this entry, not the run
+            logger.error("%s: %s", title, e, exc_info=e)
+            return page_id, None
@@ -0,0 +1,132 @@
+import logging
+from datetime import date
+from typing import Any, Dict
+
+from results_exceptions import DeadlineExceededException
+
+from .NotionWriteQueue import BACKGROUND
+from .SyncState import SyncState
+from .TMDBHandler import TMDBHandler
+from .WorkScheduler import REFRESH, WorkScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalRefresh:
+    """
+    Refresh Notion pages whose TMDB data changed since the last sync.
+
+    Instead of re-fetching every linked page, the TMDB movie and TV change
+    feeds are read from the stored watermark onwards, and only pages linked
+    to a changed ID are re-fetched, re-cleaned and queued for writing. The
+    watermark only advances when every one of them was written, so pages
+    that failed are refreshed again by the next run.
+    """
+
+    def __init__(
+        self,
+        notion_handler,
+        tmdb_handler: TMDBHandler,
+        state: SyncState,
+        scheduler: WorkScheduler | None = None,
+        deadline: float | None = None,
+    ) -> None:
+        """
+        :param scheduler: Run page refreshes as background work on this
+            scheduler, behind new entries and lookups, instead of in turn.
+        :param deadline: Seconds each scheduled page may wait to start. Pages
+            that miss it are left for the next run, which then starts from
+            the same watermark.
+        """
+        self.notion_handler = notion_handler
+        self.tmdb_handler = tmdb_handler
+        self.state = state
+        self.scheduler = scheduler
+        self.deadline = deadline
+
+    def run(self) -> Dict[str, int]:
+        """Refresh changed pages and advance the watermark. Returns counts per type."""
+        started = date.today()
+        refreshed = {}
+        queued = []
+        # Pages that missed their deadline, failed to refresh or to be written
+        unfinished = 0
+
+        for media_type in ("movie", "tv"):
+            linked = list(self.state.pages_for(media_type))
+            if not linked:
+                refreshed[media_type] = 0
+                continue
+
+            # With no watermark yet every linked page counts as changed
+            if self.state.watermark is None:
+                changed_ids = None
+            else:
+                changed_ids = self.tmdb_handler.get_changed_ids(
+                    media_type, self.state.watermark
+                )
+
+            pages = [
+                (page_id, {"media_type": media_type, "id": tmdb_id})
+                for page_id, tmdb_id in linked
+                if changed_ids is None or tmdb_id in changed_ids
+            ]
+            if self.scheduler is None:
+                done = [page[0] for page in pages if self._refresh_page(*page)]
+            else:
+                futures = [
+                    (
+                        page[0],
+                        self.scheduler.submit(
+                            REFRESH, self._refresh_page, *page, deadline=self.deadline
+                        ),
+                    )
+                    for page in pages
+                ]
+                done = []
+                for page_id, future in futures:
+                    try:
+                        if future.result():
+                            done.append(page_id)
+                    except DeadlineExceededException:
+                        pass
+
+            count = len(done)
+            queued.extend(done)
+            unfinished += len(pages) - count
+            refreshed[media_type] = count
+            logger.info(
+                "Refreshing %d of %d linked %s page(s)", count, len(linked), media_type
+            )
+
+        # Only the refreshed pages, so new entries' writes aren't claimed here
+        for write_result in self.notion_handler.flush_updates(queued).values():
+            if not write_result.success:
+                logger.error(
+                    "Writing page %s failed: %s",
+                    write_result.page_id,
+                    write_result.error,
+                )
+                unfinished += 1
+
+        if unfinished:
+            logger.warning(
+                "%d page(s) missed their deadline or failed; keeping the watermark",
+                unfinished,
+            )
+        else:
+            # Changes made while this run was going are picked up by the next one
+            self.state.watermark = started
+        self.state.save()
+        return refreshed
+
+    def _refresh_page(self, page_id: str, tmdb_result: Dict[str, Any]) -> bool:
+        """Re-fetch and queue one page. Returns whether it was queued."""
+        try:
+            cleaned_data = self.tmdb_handler.fetch_cleaned(tmdb_result, refresh=True)
+        except Exception as e:
+            logger.error("Refreshing page %s failed: %s", page_id, e)
+            return False
+
+        self.notion_handler.queue_update(page_id, cleaned_data, priority=BACKGROUND)
+        return True
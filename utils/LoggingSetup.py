@@ -0,0 +1,122 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+CONSOLE_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "run_id"}
+
+_listener: QueueListener | None = None
+run_id: str | None = None
+
+
+class RunIdFilter(logging.Filter):
+    """Tag every record with the ID of the current run."""
+
+    def __init__(self, run_id: str) -> None:
+        super().__init__()
+        self.run_id = run_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = self.run_id
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the writer thread.
+
+    The stock handler formats the message and traceback in the logging
+    thread before queueing; here the record is queued untouched, so the
+    calling thread only pays for creating it. Arguments must therefore not
+    be mutated after they are logged, which holds for the values logged here.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "run_id": getattr(record, "run_id", None),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(
+    log_dir: str = "logs",
+    level: int = logging.INFO,
+    console_level: int = logging.WARNING,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+) -> str:
+    """
+    Route all logging through a queue to a background writer thread, which
+    appends JSON lines to a size-rotated logs/notion.jsonl and prints
+    warnings and errors to the console. Safe to call more than once; only
+    the first call configures anything. Returns the run's correlation ID.
+    """
+    global _listener, run_id
+
+    if _listener is not None:
+        return run_id  # type: ignore
+
+    run_id = uuid.uuid4().hex[:12]
+    os.makedirs(log_dir, exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, "notion.jsonl"),
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RunIdFilter(run_id))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    return run_id
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,420 @@
+from datetime import date
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+IMAGE_URL = "https://image.tmdb.org/t/p/original"
+YOUTUBE_URL = "https://www.youtube.com/watch?v="
+IMDB_URL = "https://www.imdb.com/title/"
+
+# Most cast members to list
+CAST_LIMIT = 10
+
+
+def _today() -> str:
+    return date.today().isoformat()
+
+
+class Rule(NamedTuple):
+    """
+    One step of an extraction spec.
+
+    The value found at path (a tuple of keys into the raw TMDB response, or
+    the whole response for an empty path) is passed through transform, and
+    the result is stored under outputs. A rule with a tuple of outputs has a
+    transform returning one value per output, so related fields can be built
+    from a single pass over a list.
+    """
+
+    outputs: str | Tuple[str, ...]
+    path: Tuple[str, ...]
+    transform: Callable[[Any], Any] | None = None
+
+
+def field(output: str, *path: str, transform=None) -> Rule:
+    """Rule for a single output field; the path defaults to the output's name."""
+    return Rule(output, path or (output,), transform)
+
+
+def fields(outputs: Tuple[str, ...], *path: str, transform) -> Rule:
+    """Rule for several output fields built from the same value."""
+    return Rule(outputs, path, transform)
+
+
+def constant(output: str, value: Any) -> Rule:
+    return Rule(output, (), lambda _: value)
+
+
+def computed(output: str, transform) -> Rule:
+    """Rule for a field computed from several top-level values of the response."""
+    return Rule(output, (), transform)
+
+
+class MediaExtractor:
+    """
+    Single-pass extractor compiled from a declarative spec.
+
+    Compiling merges the paths of every rule into a trie, so each nested
+    object of the raw response is looked up once no matter how many rules
+    read from it. Extraction builds a new record from the rule outputs and
+    leaves the raw response untouched; outputs that come out as None are
+    left out of the record.
+    """
+
+    def __init__(self, spec: List[Rule]) -> None:
+        self.spec = spec
+
+        # Number the distinct paths and build a trie of keys leading to them
+        self._slots: Dict[Tuple[str, ...], int] = {}
+        self._trie: Dict[str, Any] = {}
+        for rule in spec:
+            if rule.path and rule.path not in self._slots:
+                self._slots[rule.path] = len(self._slots)
+                node = self._trie
+                for key in rule.path:
+                    node = node.setdefault(key, {})
+                node.setdefault(None, []).append(self._slots[rule.path])
+
+        self._rules = [
+            (
+                rule.outputs,
+                self._slots.get(rule.path),
+                rule.transform,
+            )
+            for rule in spec
+        ]
+
+    def _resolve(self, node: Dict[str, Any], data: Any, values: List[Any]) -> None:
+        """Walk the trie and raw response together, filling in path values."""
+        for key, child in node.items():
+            if key is None:
+                for slot in child:
+                    values[slot] = data
+            elif isinstance(data, dict):
+                value = data.get(key)
+                if value is not None:
+                    self._resolve(child, value, values)
+
+    def extract(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        values: List[Any] = [None] * len(self._slots)
+        self._resolve(self._trie, raw, values)
+
+        record = {}
+        for outputs, slot, transform in self._rules:
+            value = values[slot] if slot is not None else raw
+            if transform is not None:
+                value = transform(value)
+
+            if isinstance(outputs, str):
+                if value is not None:
+                    record[outputs] = value
+            else:
+                for output, item in zip(outputs, value):
+                    if item is not None:
+                        record[output] = item
+
+        return record
+
+
+# Transforms shared by the specs
+
+
+def rating(vote_average):
+    return round(vote_average, 1) if vote_average else None
+
+
+def image_url(path):
+    return f"{IMAGE_URL}{path}" if path else None
+
+
+def imdb_url(imdb_id):
+    return f"{IMDB_URL}{imdb_id}/" if imdb_id else None
+
+
+def names(items):
+    """Turn a list of named objects into Notion multi-select options."""
+    return [{"name": item["name"]} for item in items or []]
+
+
+def first_name(items):
+    return items[0]["name"] if items else None
+
+
+def providers(kind):
+    """Providers of one kind (flatrate, free, ...) from a region's watch providers."""
+
+    def transform(region):
+        options = [
+            {"name": provider["provider_name"]}
+            for provider in (region or {}).get(kind, [])
+            if provider
+        ]
+        return options or None
+
+    return transform
+
+
+def crew_names(*jobs):
+    """Comma-separated crew names per job, in one pass over the crew."""
+
+    def transform(crew):
+        found: Dict[str, List[str]] = {job: [] for job in jobs}
+        for member in crew or []:
+            job_names = found.get(member["job"])
+            if job_names is not None:
+                job_names.append(member["name"])
+        return tuple(", ".join(found[job]) or None for job in jobs)
+
+    return transform
+
+
+def cast_names(cast):
+    """The first credited actors, stopping as soon as enough are found."""
+    actors = []
+    for member in cast or []:
+        if (
+            member.get("known_for_department") == "Acting"
+            and "(uncredited)" not in member.get("character", "")
+        ):
+            actors.append(member["name"])
+            if len(actors) == CAST_LIMIT:
+                break
+    return ", ".join(actors)
+
+
+def trailer_url(videos):
+    # TODO Prioritize official trailers
+    best = None
+    for video in videos or []:
+        if (
+            video["type"] == "Trailer"
+            and video["site"] == "YouTube"
+            and video["iso_3166_1"] == "US"
+            and (best is None or video["size"] > best["size"])
+        ):
+            best = video
+    return f"{YOUTUBE_URL}{best['key']}" if best else None
+
+
+def us_certification(results):
+    """Certification of the last US release date, as the old cleaner picked it."""
+    for result in results or []:
+        if result["iso_3166_1"] == "US":
+            dates = result["release_dates"]
+            return (dates[-1]["certification"] or None) if dates else None
+    return None
+
+
+def us_rating(results):
+    """US content rating of a TV show."""
+    for result in results or []:
+        if result["iso_3166_1"] == "US":
+            return result["rating"] or None
+    return None
+
+
+def episode_label(episode):
+    """Short label for an episode, e.g. "S02E05 - Title"."""
+    if not episode:
+        return None
+    label = f"S{episode['season_number']:02d}E{episode['episode_number']:02d}"
+    return f"{label} - {episode['name']}" if episode.get("name") else label
+
+
+def air_date(episode):
+    return episode.get("air_date") if episode else None
+
+
+def season_episodes(raw):
+    """Episodes of every appended season (season/N), in season order."""
+    seasons = sorted(
+        (value for key, value in raw.items() if key.startswith("season/")),
+        key=lambda season: season.get("season_number") or 0,
+    )
+    return [episode for season in seasons for episode in season.get("episodes", [])]
+
+
+def episode_stats(today):
+    """
+    Runtime and aired episode count of a TV show. The runtime falls back to
+    the median episode runtime when TMDB has no episode_run_time.
+    """
+
+    def transform(raw):
+        episodes = season_episodes(raw)
+        cutoff = today()
+        aired = [
+            episode
+            for episode in episodes
+            if episode.get("air_date") and episode["air_date"] <= cutoff
+        ]
+
+        runtime = first(raw.get("episode_run_time"))
+        if runtime is None:
+            runtimes = sorted(
+                episode["runtime"] for episode in aired if episode.get("runtime")
+            )
+            runtime = runtimes[len(runtimes) // 2] if runtimes else None
+
+        return runtime, len(aired) if episodes else None
+
+    return transform
+
+
+def season_episode_counts(seasons):
+    """Episodes per season, e.g. "S1: 10, S2: 8", leaving out specials."""
+    return ", ".join(
+        f"S{season['season_number']}: {season['episode_count']}"
+        for season in seasons or []
+        if season.get("season_number")
+    ) or None
+
+
+def first(items):
+    return items[0] if items else None
+
+
+def joined_names(people):
+    return ", ".join(person["name"] for person in people or []) or None
+
+
+def original_title(title_key, original_key):
+    """Keep the original title only when it differs from the displayed one."""
+
+    def transform(raw):
+        original = raw.get(original_key)
+        return original if original and original != raw.get(title_key) else None
+
+    return transform
+
+
+def image(reference):
+    """Image URLs on TMDB's configured image host, when reference data is used."""
+    if reference is None:
+        return image_url
+
+    def transform(path):
+        return f"{reference.image_base_url()}{path}" if path else None
+
+    return transform
+
+
+def language(reference):
+    """Language name for the original language code, when reference data is used."""
+    return reference.language_name if reference is not None else None
+
+
+def country_of_origin(reference):
+    """
+    Name of the first origin country with reference data, otherwise the
+    first production country as before.
+    """
+
+    def transform(raw):
+        codes = raw.get("origin_country")
+        if reference is not None and codes:
+            return reference.country_name(codes[0])
+        return first_name(raw.get("production_countries"))
+
+    return transform
+
+
+def movie_spec(reference=None) -> List[Rule]:
+    """
+    Spec for movie details. With a ReferenceData, codes are turned into
+    names and images use TMDB's configured host.
+    """
+    return [
+        field("title"),
+        constant("type", "Movie"),
+        field("tagline"),
+        field("tmdb_rating", "vote_average", transform=rating),
+        fields(
+            ("directors", "producers"),
+            "credits",
+            "crew",
+            transform=crew_names("Director", "Producer"),
+        ),
+        field("genres", transform=names),
+        field("runtime"),
+        field(
+            "streaming",
+            "watch/providers",
+            "results",
+            "US",
+            transform=providers("flatrate"),
+        ),
+        field(
+            "watch_free",
+            "watch/providers",
+            "results",
+            "US",
+            transform=providers("free"),
+        ),
+        field("trailer_url", "videos", "results", transform=trailer_url),
+        field("imdb_url", "imdb_id", transform=imdb_url),
+        field("synopsis", "overview"),
+        field("release_date"),
+        field("cast", "credits", "cast", transform=cast_names),
+        computed("country_of_origin", country_of_origin(reference)),
+        field("content_rating", "release_dates", "results", transform=us_certification),
+        field("poster_path", transform=image(reference)),
+        field("status"),
+        field("original_language", transform=language(reference)),
+        computed("original_title", original_title("title", "original_title")),
+        field("backdrop_path", transform=image(reference)),
+    ]
+
+
+def tv_spec(reference=None) -> List[Rule]:
+    """Spec for TV show details, see movie_spec."""
+    return [
+        field("title", "name"),
+        constant("type", "TV"),
+        field("tagline"),
+        field("tmdb_rating", "vote_average", transform=rating),
+        field("creators", "created_by", transform=joined_names),
+        fields(
+            ("producers",),
+            "credits",
+            "crew",
+            transform=crew_names("Executive Producer"),
+        ),
+        field("genres", transform=names),
+        fields(("runtime", "aired_episodes"), transform=episode_stats(_today)),
+        field(
+            "streaming",
+            "watch/providers",
+            "results",
+            "US",
+            transform=providers("flatrate"),
+        ),
+        field(
+            "watch_free",
+            "watch/providers",
+            "results",
+            "US",
+            transform=providers("free"),
+        ),
+        field("trailer_url", "videos", "results", transform=trailer_url),
+        field("imdb_url", "external_ids", "imdb_id", transform=imdb_url),
+        field("synopsis", "overview"),
+        field("release_date", "first_air_date"),
+        field("cast", "credits", "cast", transform=cast_names),
+        computed("country_of_origin", country_of_origin(reference)),
+        field("content_rating", "content_ratings", "results", transform=us_rating),
+        field("poster_path", transform=image(reference)),
+        field("status"),
+        field("original_language", transform=language(reference)),
+        computed("original_title", original_title("name", "original_name")),
+        field("backdrop_path", transform=image(reference)),
+        field("episodes", "number_of_episodes"),
+        field("seasons", "number_of_seasons"),
+        field("episodes_per_season", "seasons", transform=season_episode_counts),
+        field("last_episode", "last_episode_to_air", transform=episode_label),
+        field("upcoming_episode", "next_episode_to_air", transform=episode_label),
+        field("last_air_date"),
+        field("next_air_date", "next_episode_to_air", transform=air_date),
+    ]
+
+
+MOVIE_SPEC = movie_spec()
+TV_SPEC = tv_spec()
@@ -0,0 +1,69 @@
+from collections.abc import Mapping
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Iterator, List
+
+# Multi-select options, e.g. [{"name": "Drama"}]
+Options = List[Dict[str, str]]
+
+
+@dataclass(frozen=True, slots=True)
+class MediaRecord(Mapping):
+    """
+    Cleaned data of a movie or TV show.
+
+    Slotted and immutable, since one record can be shared by every page
+    with the same TMDB ID. It also reads as a mapping of the fields that
+    have a value, so it can be used wherever the cleaned dict was.
+    """
+
+    title: str | None = None
+    type: str | None = None
+    tagline: str | None = None
+    tmdb_rating: float | None = None
+    directors: str | None = None
+    producers: str | None = None
+    creators: str | None = None
+    genres: Options | None = None
+    runtime: int | None = None
+    streaming: Options | None = None
+    watch_free: Options | None = None
+    trailer_url: str | None = None
+    imdb_url: str | None = None
+    synopsis: str | None = None
+    release_date: str | None = None
+    cast: str | None = None
+    country_of_origin: str | None = None
+    content_rating: str | None = None
+    poster_path: str | None = None
+    status: str | None = None
+    original_language: str | None = None
+    original_title: str | None = None
+    backdrop_path: str | None = None
+    episodes: int | None = None
+    seasons: int | None = None
+    episodes_per_season: str | None = None
+    aired_episodes: int | None = None
+    last_episode: str | None = None
+    upcoming_episode: str | None = None
+    last_air_date: str | None = None
+    next_air_date: str | None = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MediaRecord":
+        """Build a record from a cleaned dict, e.g. one read back from a journal."""
+        return cls(**{name: data[name] for name in FIELD_NAMES if name in data})
+
+    def __getitem__(self, name: str) -> Any:
+        value = getattr(self, name, None) if name in FIELD_NAMES else None
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name in FIELD_NAMES if getattr(self, name) is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+FIELD_NAMES = tuple(field.name for field in fields(MediaRecord))
@@ -0,0 +1,337 @@
+import functools
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple
+
+# Latency buckets in seconds, covering cache hits up to slow, retried requests
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _labels(self, values: LabelValues, extra: Dict[str, str] | None = None) -> str:
+        pairs = list(zip(self.label_names, values)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def family_name(self, openmetrics: bool) -> str:
+        return self.name
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        raise NotImplementedError
+
+    def render(self, openmetrics: bool) -> List[str]:
+        family = self.family_name(openmetrics)
+        return [
+            f"# HELP {family} {self.documentation}",
+            f"# TYPE {family} {self.type_name}",
+            *self.samples(openmetrics),
+        ]
+
+
+class Counter(_Metric):
+    """Monotonic count, exposed with a _total suffix."""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def family_name(self, openmetrics):
+        # OpenMetrics names the family without the suffix, Prometheus with it
+        return self.name if openmetrics else f"{self.name}_total"
+
+    def samples(self, openmetrics):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}_total{self._labels(key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self, openmetrics):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{self._labels(key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager observing the duration of its block."""
+        return _Timer(self, labels)
+
+    def samples(self, openmetrics):
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._counts.items())
+            sums = dict(self._sums)
+
+        lines = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                labels = self._labels(key, {"le": le})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(sums[key])}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    """A set of metrics rendered together in OpenMetrics or Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self._register(Counter(name, documentation, labels))  # type: ignore
+
+    def gauge(self, name, documentation, labels=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))  # type: ignore
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self, openmetrics: bool = True) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = [line for metric in metrics for line in metric.render(openmetrics)]
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Write the metrics for node exporter's textfile collector, which reads
+        the Prometheus text format. The file is replaced atomically.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as textfile:
+            textfile.write(self.render(openmetrics=False))
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Serve the metrics over HTTP from a background thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                # Scrapers asking for OpenMetrics get it, others the Prometheus format
+                openmetrics = "application/openmetrics-text" in self.headers.get(
+                    "Accept", ""
+                )
+                body = registry.render(openmetrics).encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE,
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Collapse IDs in an endpoint path, e.g. movie/155 -> movie/{id}."""
+    return re.sub(r"/\d+", "/{id}", endpoint.strip("/"))
+
+
+# Process-wide registry the handlers record into
+METRICS = MetricsRegistry()
+
+TMDB_REQUESTS = METRICS.counter(
+    "tmdb_requests", "TMDB HTTP responses by endpoint and status.", ("endpoint", "status")
+)
+TMDB_REQUEST_SECONDS = METRICS.histogram(
+    "tmdb_request_duration_seconds", "TMDB HTTP request latency.", ("endpoint",)
+)
+TMDB_RETRIES = METRICS.counter(
+    "tmdb_retries", "TMDB requests retried, by reason.", ("endpoint", "reason")
+)
+TMDB_RATE_LIMITED = METRICS.counter(
+    "tmdb_rate_limited", "TMDB responses with status 429.", ("endpoint",)
+)
+CACHE_LOOKUPS = METRICS.counter(
+    "tmdb_cache_lookups", "TMDB cache lookups by result.", ("result",)
+)
+CACHE_HIT_RATIO = METRICS.gauge(
+    "tmdb_cache_hit_ratio", "Share of TMDB cache lookups served from the cache."
+)
+NOTION_REQUESTS = METRICS.counter(
+    "notion_requests", "Notion API calls by operation and status.", ("operation", "status")
+)
+NOTION_REQUEST_SECONDS = METRICS.histogram(
+    "notion_request_duration_seconds", "Notion API call latency.", ("operation",)
+)
+NOTION_RATE_LIMITED = METRICS.counter(
+    "notion_rate_limited", "Notion calls answered with status 429.", ("operation",)
+)
+NOTION_PAGE_UPDATES = METRICS.counter(
+    "notion_page_updates",
+    "Page updates sent, skipped as unchanged or failed.",
+    ("result",),
+)
+RATE_LIMIT_WAIT_SECONDS = METRICS.histogram(
+    "rate_limit_wait_seconds",
+    "Time spent waiting on a shared rate-limit bucket before a request.",
+    ("bucket",),
+)
+STAGE_SECONDS = METRICS.histogram(
+    "pipeline_stage_duration_seconds",
+    "Time spent per item in each enrichment stage.",
+    ("stage",),
+)
+ITEMS_PROCESSED = METRICS.counter(
+    "pipeline_items_processed", "Items that completed an enrichment stage.", ("stage",)
+)
+COALESCED_CALLS = METRICS.counter(
+    "pipeline_coalesced_calls",
+    "Calls that shared the result of an identical call instead of repeating it.",
+    ("call",),
+)
+SCHEDULER_WAIT_SECONDS = METRICS.histogram(
+    "scheduler_wait_seconds",
+    "Time work items spent queued before a worker started them.",
+    ("work_class",),
+)
+SCHEDULER_EXPIRED = METRICS.counter(
+    "scheduler_expired",
+    "Work items dropped because their deadline passed while queued.",
+    ("work_class",),
+)
+ITEMS_PER_SECOND = METRICS.gauge(
+    "pipeline_items_per_second", "Entries processed per second over the last run."
+)
+
+
+def timed_stage(stage: str):
+    """Decorator recording a pipeline stage's duration and completed items."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+            ITEMS_PROCESSED.inc(stage=stage)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def record_cache_lookup(result: str) -> None:
+    """Count a cache lookup (hit, miss or stale) and update the hit ratio."""
+    CACHE_LOOKUPS.inc(result=result)
+    hits = CACHE_LOOKUPS.value(result="hit")
+    total = hits + CACHE_LOOKUPS.value(result="miss") + CACHE_LOOKUPS.value(result="stale")
+    CACHE_HIT_RATIO.set(hits / total if total else 0.0)
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .Metrics import ITEMS_PER_SECOND
+from .NotionHandler import NotionHandler
+from .RateLimiter import RateLimiter
+from .SyncState import SyncState
+from .TMDBHandler import TMDBHandler
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseShard:
+    """One Notion database in a multi-database sync, with its own rate budget."""
+
+    def __init__(
+        self, name: str, notion_handler: NotionHandler, state: SyncState | None = None
+    ) -> None:
+        self.name = name
+        self.notion_handler = notion_handler
+        self.state = state
+        self.counts = {"found": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def summary(self) -> Dict[str, int]:
+        """Entries found and failed, plus the handler's written/skipped/failed pages."""
+        with self._lock:
+            return {**self.counts, **self.notion_handler.write_counts}
+
+
+def load_shards(
+    path: str, state_dir: str = "state", rate_limit_path: str | None = None
+) -> List[DatabaseShard]:
+    """
+    Build shards from a JSON config, e.g.
+
+        {"databases": [
+            {"name": "films", "database_id": "...", "write_rate": 3.0},
+            {"name": "series", "database_id": "...",
+             "api_key_env": "NOTION_API_KEY_SERIES"}
+        ]}
+
+    Each database gets its own Notion client, write queue and sync state
+    (state/<name>.sqlite3). The Notion key is read from the environment variable
+    named by api_key_env, NOTION_API_KEY by default. With rate_limit_path,
+    databases sharing a key also share one rate-limit bucket, as do other
+    processes using that key.
+    """
+    with open(path, "r") as json_file:
+        config = json.load(json_file)
+
+    shards = []
+    for database in config["databases"]:
+        name = database["name"]
+        state = SyncState(os.path.join(state_dir, f"{name}.sqlite3"))
+        api_key_env = database.get("api_key_env", "NOTION_API_KEY")
+        limiter = None
+        if rate_limit_path:
+            # Notion's limit applies per integration, i.e. per key
+            limiter = RateLimiter(
+                f"notion:{api_key_env}",
+                database.get("write_rate", 3.0),
+                path=rate_limit_path,
+            )
+        notion_handler = NotionHandler(
+            os.getenv(api_key_env),
+            database["database_id"],
+            write_concurrency=database.get("write_concurrency", 3),
+            write_rate=database.get("write_rate", 3.0),
+            state=state,
+            limiter=limiter,
+        )
+        shards.append(DatabaseShard(name, notion_handler, state))
+    return shards
+
+
+class MultiDatabaseSync:
+    """
+    Sync several Notion databases in one process.
+
+    All databases share one TMDB handler, and so its cache and connection
+    pool, and one pool of workers. Entries are taken from the databases in
+    turn, so a large database can't hold the workers while a small one
+    waits. Writes go to each database's own write queue, so every database
+    gets its own Notion rate budget and the queues drain side by side.
+    """
+
+    def __init__(
+        self, shards: List[DatabaseShard], tmdb_handler: TMDBHandler, workers: int = 8
+    ) -> None:
+        self.shards = shards
+        self.tmdb_handler = tmdb_handler
+        self.workers = workers
+
+    def run(self) -> Dict[str, Dict[str, int]]:
+        """Sync every database and return counts per database."""
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="shard"
+        ) as executor:
+            pending: Dict[Future, DatabaseShard] = {}
+            for shard, entry in self._interleave():
+                future = executor.submit(self._process_entry, shard, entry)
+                pending[future] = shard
+                # Keep the pool busy without queueing a whole database
+                if len(pending) >= 2 * self.workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._check(future, pending.pop(future))
+            for future in wait(pending).done:
+                self._check(future, pending.pop(future))
+
+            # Each database's queue drains at its own rate, all at once
+            list(executor.map(self._flush, self.shards))
+
+        found = sum(shard.counts["found"] for shard in self.shards)
+        ITEMS_PER_SECOND.set(found / (time.perf_counter() - started))
+        return {shard.name: shard.summary() for shard in self.shards}
+
+    @staticmethod
+    def _check(future: Future, shard: DatabaseShard) -> None:
+        """Count and log an entry that failed with anything but a missing match."""
+        error = future.exception()
+        if error is not None:
+            logger.error("%s: entry failed: %s", shard.name, error, exc_info=error)
+            shard.count("errors")
+
+    def _interleave(self) -> Iterator[Tuple[DatabaseShard, Dict[str, Any]]]:
+        """Yield entries round-robin across databases until all are exhausted."""
+        active = deque(
+            (shard, shard.notion_handler.iter_entries_to_update())
+            for shard in self.shards
+        )
+
+        while active:
+            shard, entries = active.popleft()
+            try:
+                entry = next(entries)
+            except StopIteration:
+                logger.info("Queued %d entries of %s", shard.counts["found"], shard.name)
+                continue
+            except Exception as e:
+                # A broken database must not stop the others
+                logger.error("%s: query failed: %s", shard.name, e)
+                shard.count("errors")
+                continue
+
+            shard.count("found")
+            active.append((shard, entries))
+            yield shard, entry
+
+    def _process_entry(self, shard: DatabaseShard, entry: Dict[str, Any]) -> None:
+        title = entry["properties"]["Title"]["title"][0]["plain_text"].rstrip(";")
+        page_id = entry["id"]
+
+        try:
+            tmdb_result = self.tmdb_handler.resolve_title(title)
+            cleaned_data = self.tmdb_handler.fetch_cleaned(tmdb_result)
+        except ValueError as e:
+            logger.error("%s: %s: %s", shard.name, title, e)
+            shard.count("errors")
+            return
+
+        shard.notion_handler.queue_update(page_id, cleaned_data, marked=True)
+        if shard.state:
+            shard.state.link(page_id, tmdb_result)
+
+    def _flush(self, shard: DatabaseShard) -> None:
+        for write_result in shard.notion_handler.flush_updates().values():
+            if not write_result.success:
+                logger.error(
+                    "%s: writing page %s failed: %s",
+                    shard.name,
+                    write_result.page_id,
+                    write_result.error,
+                )
+
+        if shard.state:
+            shard.state.save()
@@ -1,39 +1,372 @@
-from typing import Any, Dict, List
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List
 
-from notion_client import Client
+from notion_client import APIResponseError, Client
+
+from .Metrics import (
+    NOTION_PAGE_UPDATES,
+    NOTION_RATE_LIMITED,
+    NOTION_REQUEST_SECONDS,
+    NOTION_REQUESTS,
+)
+from .NotionWriteQueue import URGENT, NotionWriteQueue, WriteResult
+from .PropertyEncoder import PropertyEncoder
+from .RateLimiter import RateLimiter
+from .SyncState import SyncState
+
+logger = logging.getLogger(__name__)
 
 
 class NotionHandler:
     # TODO catch database_id and client not found exceptions
-    def __init__(self, api_key: str | None, database_id: str | None) -> None:
-        self.client = Client(auth=api_key)
+    def __init__(
+        self,
+        api_key: str | None,
+        database_id: str | None,
+        write_concurrency: int = 3,
+        write_rate: float = 3.0,
+        client_options: Dict[str, Any] | None = None,
+        max_retries: int = 3,
+        state: SyncState | None = None,
+        schema_dir: str | None = "cache/notion_schema",
+        schema_ttl: float = 86400.0,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        """
+        :param write_rate: Page updates per second, Notion's average rate limit.
+        :param client_options: Extra notion_client options, e.g. base_url.
+        :param max_retries: Retries of a rate limited database query.
+        :param state: Where digests of written values are kept; with it,
+            queued updates only send what changed since the last write.
+        :param schema_dir: Where the database's property schema is cached
+            between runs, or None to fetch it once per process.
+        :param schema_ttl: Seconds a cached schema is used before refetching.
+        :param limiter: Token bucket shared by every process using the same
+            integration; all requests, reads and writes alike, wait on it.
+        """
+        self.client = Client(auth=api_key, **(client_options or {}))
+        self.max_retries = max_retries
         self.database_id = database_id
+        self.limiter = limiter
+        self.write_queue = NotionWriteQueue(
+            self.client,
+            requests_per_second=write_rate,
+            workers=write_concurrency,
+            limiter=limiter,
+        )
+        self.state = state
+        # Page ID -> what became of its writes this run: written, skipped or failed
+        self._outcomes: Dict[str, str] = {}
+        self._queued_digests: Dict[str, Dict[str, str]] = {}
+        self._digest_lock = threading.Lock()
+        # Results of writes also claimed by a later flush of the same page
+        self._unclaimed: Dict[str, WriteResult] = {}
+        self.schema_dir = schema_dir
+        self.schema_ttl = schema_ttl
+        self._encoder: PropertyEncoder | None = None
+        self._encoder_lock = threading.Lock()
+
+    @property
+    def write_counts(self) -> Dict[str, int]:
+        """Pages written, skipped as unchanged and failed, each page counted once."""
+        with self._digest_lock:
+            counts = {"written": 0, "skipped": 0, "failed": 0}
+            for outcome in self._outcomes.values():
+                counts[outcome] += 1
+        return counts
 
     def get_entries_to_update(self, title: str | None = None) -> List[Dict[str, Any]]:
         """Fetch entries with titles ending in semicolon, or for the given title."""
 
-        query = {"database_id": self.database_id, "filter": {"property": "Title"}}
+        return list(self.iter_entries_to_update(title))
+
+    def iter_entries_to_update(
+        self,
+        title: str | None = None,
+        page_size: int = 100,
+        edited_since: str | None = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield entries with titles ending in semicolon, or for the given title.
+        Follows the query cursor across every page of results, fetching the
+        next page in the background while the current one is consumed.
+
+        :param edited_since: Only entries last edited at or after this ISO
+            timestamp, oldest edit first.
+        """
 
+        title_filter: Dict[str, Any] = {"property": "Title"}
         if title:
-            query["filter"]["title"] = {"equals": title}
+            title_filter["title"] = {"equals": title}
         else:
-            query["filter"]["title"] = {"ends_with": ";"}
+            title_filter["title"] = {"ends_with": ";"}
 
-        # Any is to silence pylance(reportAttributeAccessIssue) error
-        response: Any = self.client.databases.query(**query)
-        return response.get("results", [])
+        query = {
+            "database_id": self.database_id,
+            "filter": title_filter,
+            # Only the title is read downstream; page IDs are always returned
+            "filter_properties": ["title"],
+            "page_size": page_size,
+        }
 
-    def update_page(self, page_id, data):
-        """Update page properties with cleaned data."""
+        if edited_since:
+            query["filter"] = {
+                "and": [
+                    title_filter,
+                    {
+                        "timestamp": "last_edited_time",
+                        "last_edited_time": {"on_or_after": edited_since},
+                    },
+                ]
+            }
+            query["sorts"] = [{"timestamp": "last_edited_time", "direction": "ascending"}]
 
-        self.client.pages.update(page_id=page_id, properties=data)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self._query_page, query, None)
 
-        # Set the icon and cover images
-        self.client.pages.update(
-            page_id=page_id,
-            icon={"type": "external", "external": {"url": data.get("poster_path")}},
+            while future is not None:
+                response = future.result()
+
+                if response.get("has_more") and response.get("next_cursor"):
+                    future = executor.submit(
+                        self._query_page, query, response["next_cursor"]
+                    )
+                else:
+                    future = None
+
+                yield from response.get("results", [])
+
+    def _query_page(self, query: Dict[str, Any], cursor: str | None) -> Any:
+        """Run a single database query, starting at the given cursor."""
+
+        if cursor:
+            query = {**query, "start_cursor": cursor}
+
+        return self._request("databases.query", self.client.databases.query, **query)
+
+    def _request(self, operation: str, method, **kwargs) -> Any:
+        """Make a database request, retrying while rate limited."""
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+            try:
+                with NOTION_REQUEST_SECONDS.time(operation=operation):
+                    # Any is to silence pylance(reportAttributeAccessIssue) error
+                    response: Any = method(**kwargs)
+                NOTION_REQUESTS.inc(operation=operation, status="200")
+                return response
+            except APIResponseError as e:
+                NOTION_REQUESTS.inc(operation=operation, status=str(e.status))
+                if e.status == 429:
+                    NOTION_RATE_LIMITED.inc(operation=operation)
+                if e.status != 429 or attempt == self.max_retries:
+                    raise
+                retry_after = float(e.headers.get("retry-after", 1))
+                logger.warning("%s rate limited, retrying in %ss", operation, retry_after)
+                if self.limiter:
+                    # The bucket holds this and every other process back
+                    self.limiter.penalize(retry_after)
+                else:
+                    time.sleep(retry_after)
+
+    def get_schema(self) -> Dict[str, Any]:
+        """
+        Return the database's property schema, from the cache if it is
+        fresh enough, otherwise from Notion.
+        """
+
+        path = None
+        if self.schema_dir and self.database_id:
+            path = os.path.join(self.schema_dir, f"{self.database_id}.json")
+            try:
+                if time.time() - os.path.getmtime(path) < self.schema_ttl:
+                    with open(path) as json_file:
+                        return json.load(json_file)
+            except (OSError, ValueError):
+                pass
+
+        database = self._request(
+            "databases.retrieve",
+            self.client.databases.retrieve,
+            database_id=self.database_id,
         )
+        schema = database["properties"]
+
+        if path:
+            os.makedirs(self.schema_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as json_file:
+                json.dump(schema, json_file)
+            os.replace(tmp_path, path)
+        return schema
+
+    def property_encoder(self) -> PropertyEncoder:
+        """The encoder for this database, compiled on first use."""
+
+        with self._encoder_lock:
+            if self._encoder is None:
+                self._encoder = PropertyEncoder(self.get_schema())
+                logger.info(
+                    "Writing Notion properties: %s",
+                    ", ".join(self._encoder.properties),
+                )
+            return self._encoder
+
+    def update_page(self, page_id, data):
+        """Update page properties, icon and cover with cleaned data in one request."""
+
         self.client.pages.update(
-            page_id=page_id,
-            cover={"type": "external", "external": {"url": data.get("backdrop_path")}},
+            page_id=page_id, **self._page_payload(data, self.property_encoder())
+        )
+
+    def queue_update(self, page_id, data, marked: bool = False, priority: int = URGENT):
+        """
+        Queue a page update; it is sent in the background by the write queue.
+        With a state, only properties, icon and cover whose values differ from
+        the last ones written are sent, and nothing at all if none do.
+
+        :param marked: The page was picked by its semicolon marker. Its title
+            is then always written, since the page holds the marked title
+            whatever was written before, and a skipped write would leave the
+            marker in place for every later run to pick up again.
+        :param priority: Write priority, e.g. BACKGROUND for refreshes, so
+            they don't hold up the writes of new entries.
+        """
+
+        encoder = self.property_encoder()
+        payload = self._page_payload(data, encoder)
+        if self.state is None:
+            with self._digest_lock:
+                self._queued_digests.setdefault(page_id, {})
+                self.write_queue.enqueue(page_id, **payload, priority=priority)
+            return
+
+        digests = {
+            f"properties.{name}": self._digest(value)
+            for name, value in payload["properties"].items()
+        }
+        for key in ("icon", "cover"):
+            if key in payload:
+                digests[key] = self._digest(payload[key])
+
+        with self._digest_lock:
+            # Compare against what is already queued for the page, if anything
+            current = {
+                **self.state.written_digests(page_id),
+                **self._queued_digests.get(page_id, {}),
+            }
+            changed = {
+                key: digest for key, digest in digests.items() if current.get(key) != digest
+            }
+            title_key = f"properties.{encoder.title_property}"
+            if marked and title_key in digests:
+                changed[title_key] = digests[title_key]
+            if not changed:
+                # A page written or failed earlier in the run stays counted as such
+                self._outcomes.setdefault(page_id, "skipped")
+                NOTION_PAGE_UPDATES.inc(result="skipped")
+                logger.debug("Skipping unchanged Notion page %s", page_id)
+                return
+            self._queued_digests[page_id] = {
+                **self._queued_digests.get(page_id, {}),
+                **changed,
+            }
+
+            # Enqueued under the lock, so a flush that claims the page sends it
+            properties = {
+                name: value
+                for name, value in payload["properties"].items()
+                if f"properties.{name}" in changed
+            }
+            self.write_queue.enqueue(
+                page_id,
+                properties=properties,
+                icon=payload.get("icon") if "icon" in changed else None,
+                cover=payload.get("cover") if "cover" in changed else None,
+                priority=priority,
+            )
+
+    def flush_updates(
+        self, pages: Iterable[str] | None = None
+    ) -> Dict[str, WriteResult]:
+        """
+        Send queued updates and return the results of the pages queued since
+        their last flush. Digests of successful writes are recorded in the
+        state.
+
+        :param pages: Only flush and claim these pages. Callers sharing the
+            handler, such as the watch loop and a background refresh, pass
+            their own pages, so neither waits for nor claims the other's.
+        """
+
+        with self._digest_lock:
+            if pages is None:
+                queued, self._queued_digests = self._queued_digests, {}
+            else:
+                queued = {
+                    page_id: self._queued_digests.pop(page_id)
+                    for page_id in set(pages)
+                    if page_id in self._queued_digests
+                }
+        written = self.write_queue.flush(queued)
+
+        results = {}
+        with self._digest_lock:
+            for page_id, digests in queued.items():
+                result = written.get(page_id, self._unclaimed.pop(page_id, None))
+                if result is not None and page_id in self._queued_digests:
+                    # Queued again meanwhile, and maybe merged into this write
+                    self._unclaimed[page_id] = result
+                if result is not None:
+                    results[page_id] = result
+                if result is not None and result.success:
+                    self._outcomes[page_id] = "written"
+                    NOTION_PAGE_UPDATES.inc(result="written")
+                    if self.state is not None:
+                        self.state.record_written(page_id, digests)
+                else:
+                    self._outcomes[page_id] = "failed"
+                    NOTION_PAGE_UPDATES.inc(result="failed")
+
+        counts = self.write_counts
+        logger.info(
+            "Notion pages: %d written, %d skipped as unchanged, %d failed",
+            counts["written"],
+            counts["skipped"],
+            counts["failed"],
         )
+        return results
+
+    @staticmethod
+    def _digest(value: Any) -> str:
+        """Short, stable hash of a property, icon or cover value."""
+
+        encoded = json.dumps(value, sort_keys=True, default=str).encode()
+        return hashlib.sha1(encoded).hexdigest()[:16]
+
+    @staticmethod
+    def _page_payload(data, encoder: PropertyEncoder) -> Dict[str, Any]:
+        """Build the properties, icon and cover arguments of a page update."""
+
+        payload: Dict[str, Any] = {"properties": encoder.encode(data)}
+
+        # Set the icon and cover images
+        if data.get("poster_path"):
+            payload["icon"] = {
+                "type": "external",
+                "external": {"url": data.get("poster_path")},
+            }
+        if data.get("backdrop_path"):
+            payload["cover"] = {
+                "type": "external",
+                "external": {"url": data.get("backdrop_path")},
+            }
+
+        return payload
@@ -0,0 +1,270 @@
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple
+
+from .Metrics import (
+    ITEMS_PROCESSED,
+    NOTION_RATE_LIMITED,
+    NOTION_REQUEST_SECONDS,
+    NOTION_REQUESTS,
+    STAGE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Write priorities, most urgent first: new entries and lookups a user is
+# waiting for, then background work such as refreshes
+URGENT = 0
+BACKGROUND = 1
+PRIORITIES = (URGENT, BACKGROUND)
+
+
+class WriteResult(NamedTuple):
+    page_id: str
+    success: bool
+    error: str | None = None
+
+
+class NotionWriteQueue:
+    """
+    Write-behind queue for Notion page updates.
+
+    Properties, icon and cover for a page are merged into a single
+    pages.update request. Updates to a page that is still queued are
+    coalesced, so only its latest state is sent. Background threads drain
+    the queue at the Notion rate limit, holding each page back for a short
+    window after its last update so that repeat updates can still be merged.
+
+    Every update has a priority. Urgent pages are sent before background
+    ones whenever both are ready, so a new entry's write doesn't wait behind
+    a refresh's backlog. Each flush waits for, and claims the results of,
+    only the pages it is given.
+    """
+
+    def __init__(
+        self,
+        client,
+        requests_per_second: float = 3.0,
+        coalesce_window: float = 2.0,
+        max_retries: int = 3,
+        workers: int = 3,
+        limiter=None,
+    ) -> None:
+        """
+        :param limiter: RateLimiter shared with other processes writing to the
+            same Notion integration; it then paces requests instead of
+            requests_per_second.
+        """
+        self.client = client
+        self.limiter = limiter
+        self.interval = 1.0 / requests_per_second
+        self.workers = workers
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.results: Dict[str, WriteResult] = {}
+        self.listeners: List[Callable[[WriteResult], None]] = []
+
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Per priority, page ID -> time of its last update, oldest first
+        self._queued_at: List[OrderedDict[str, float]] = [
+            OrderedDict() for _ in PRIORITIES
+        ]
+        self._priority: Dict[str, int] = {}
+        self._sending: Counter[str] = Counter()
+        # Pages a flush is waiting for, sent without waiting out their window;
+        # while a flush of everything runs, no page waits it out
+        self._flushing: Counter[str] = Counter()
+        self._flushing_all = 0
+        self._next_request = 0.0
+        self._condition = threading.Condition()
+        self._pace_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._pending) + sum(self._sending.values())
+
+    def enqueue(
+        self,
+        page_id: str,
+        properties: Dict[str, Any] | None = None,
+        icon: Dict[str, Any] | None = None,
+        cover: Dict[str, Any] | None = None,
+        priority: int = URGENT,
+    ) -> None:
+        """
+        Queue an update, merging it into any update still pending for the page.
+        A merged update keeps the more urgent of the two priorities.
+        """
+        with self._condition:
+            payload = self._pending.pop(page_id, {})
+            if properties:
+                payload["properties"] = {**payload.get("properties", {}), **properties}
+            if icon:
+                payload["icon"] = icon
+            if cover:
+                payload["cover"] = cover
+
+            # Re-inserting moves the page to the back of its queue
+            previous = self._priority.pop(page_id, None)
+            if previous is not None:
+                del self._queued_at[previous][page_id]
+                priority = min(priority, previous)
+            self._pending[page_id] = payload
+            self._priority[page_id] = priority
+            self._queued_at[priority][page_id] = time.monotonic()
+
+            if not self._threads:
+                # Several workers keep the rate limit busy despite request latency
+                for i in range(self.workers):
+                    thread = threading.Thread(
+                        target=self._drain, name=f"notion-write-{i}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+            self._condition.notify_all()
+
+    def flush(self, pages: Iterable[str] | None = None) -> Dict[str, WriteResult]:
+        """
+        Send the given pages, or everything still queued, ignoring the
+        coalescing window, and block until they are written. Returns and
+        forgets the results of the latest writes of those pages, or of every
+        write not yet claimed; results of other pages are left for their own
+        flush.
+        """
+        with self._condition:
+            if pages is None:
+                self._flushing_all += 1
+                self._condition.notify_all()
+                try:
+                    while self._threads and (self._pending or self._sending):
+                        self._condition.wait()
+                finally:
+                    self._flushing_all -= 1
+                results, self.results = self.results, {}
+                return results
+
+            pages = set(pages)
+            self._flushing.update(pages)
+            self._condition.notify_all()
+            try:
+                while self._threads and any(
+                    page_id in self._pending or self._sending[page_id]
+                    for page_id in pages
+                ):
+                    self._condition.wait()
+            finally:
+                self._flushing.subtract(pages)
+                self._flushing = +self._flushing
+            return {
+                page_id: self.results.pop(page_id)
+                for page_id in pages
+                if page_id in self.results
+            }
+
+    def _next_ready(self) -> tuple[str, Dict[str, Any]] | None:
+        """
+        Pop the most urgent page that is ready to send: its coalescing window
+        has passed or a flush is waiting for it. Oldest first within a priority.
+        """
+        now = time.monotonic()
+        for queued_at in self._queued_at:
+            for page_id, updated in queued_at.items():
+                waiting = now - updated < self.coalesce_window
+                if waiting and not (self._flushing_all or self._flushing[page_id]):
+                    # Later pages were updated later still, but may be flushed
+                    if not self._flushing:
+                        break
+                    continue
+                del queued_at[page_id]
+                del self._priority[page_id]
+                return page_id, self._pending.pop(page_id)
+        return None
+
+    def _next_due(self) -> float | None:
+        """Seconds until the oldest pending page's window passes."""
+        oldest = [
+            next(iter(queued_at.values())) for queued_at in self._queued_at if queued_at
+        ]
+        if not oldest:
+            return None
+        return max(0.0, self.coalesce_window - (time.monotonic() - min(oldest)))
+
+    def _drain(self) -> None:
+        while True:
+            with self._condition:
+                item = self._next_ready()
+                while item is None:
+                    # Wake up when the oldest page's window is due to pass
+                    self._condition.wait(self._next_due())
+                    item = self._next_ready()
+                page_id, payload = item
+                self._sending[page_id] += 1
+
+            try:
+                result = self.results[page_id] = self._send(page_id, payload)
+                # Listeners hear of each write as it lands, e.g. to checkpoint it
+                for listener in self.listeners:
+                    listener(result)
+            finally:
+                with self._condition:
+                    self._sending[page_id] -= 1
+                    if not self._sending[page_id]:
+                        del self._sending[page_id]
+                    self._condition.notify_all()
+
+    def _pace(self) -> None:
+        """Sleep until the next request slot under the rate limit."""
+        if self.limiter:
+            self.limiter.acquire()
+            return
+        with self._pace_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request)
+            self._next_request = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _send(self, page_id: str, payload: Dict[str, Any]) -> WriteResult:
+        started = time.perf_counter()
+        result = self._send_with_retries(page_id, payload)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="write")
+        if result.success:
+            ITEMS_PROCESSED.inc(stage="write")
+        return result
+
+    def _send_with_retries(self, page_id: str, payload: Dict[str, Any]) -> WriteResult:
+        for attempt in range(self.max_retries + 1):
+            self._pace()
+            try:
+                with NOTION_REQUEST_SECONDS.time(operation="pages.update"):
+                    self.client.pages.update(page_id=page_id, **payload)
+                NOTION_REQUESTS.inc(operation="pages.update", status="200")
+                logger.info("Updated Notion page %s", page_id)
+                return WriteResult(page_id, True)
+            except Exception as e:
+                status = getattr(e, "status", None)
+                NOTION_REQUESTS.inc(
+                    operation="pages.update", status=str(status or "error")
+                )
+                if status == 429:
+                    NOTION_RATE_LIMITED.inc(operation="pages.update")
+                if status == 429 and attempt < self.max_retries:
+                    headers = getattr(e, "headers", None) or {}
+                    retry_after = float(headers.get("retry-after", 1))
+                    logger.warning(
+                        "Rate limited updating page %s, retrying in %ss",
+                        page_id,
+                        retry_after,
+                    )
+                    if self.limiter:
+                        self.limiter.penalize(retry_after)
+                    with self._pace_lock:
+                        self._next_request = time.monotonic() + retry_after
+                    continue
+                logger.error("Failed to update Notion page %s: %s", page_id, e)
+                return WriteResult(page_id, False, str(e))
+
+        return WriteResult(page_id, False, "Retries exhausted")
@@ -0,0 +1,155 @@
+import logging
+import re
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, List, Tuple
+
+from .MediaRecord import FIELD_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Notion rejects rich text objects longer than this
+TEXT_LIMIT = 2000
+
+# Record fields that are page icon and cover rather than properties, unless
+# the database happens to have a property of the same name
+IMAGE_FIELDS = ("poster_path", "backdrop_path")
+
+
+def _normalize(name: str) -> str:
+    """Match "tmdb_rating" to a "TMDB Rating" property."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, list):
+        value = ", ".join(_name(item) for item in value)
+    return str(value)
+
+
+def _name(item: Any) -> str:
+    return item["name"] if isinstance(item, dict) else str(item)
+
+
+def _empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+# Encoders get every field, set or not: an empty value encodes to the
+# property's cleared value, so a value gone from TMDB is also gone from Notion
+
+
+def encode_title(value: Any) -> Dict[str, Any] | None:
+    # A page keeps its title; there is nothing better to replace it with
+    if _empty(value):
+        return None
+    return {"title": [{"text": {"content": _text(value)[:TEXT_LIMIT]}}]}
+
+
+def encode_rich_text(value: Any) -> Dict[str, Any]:
+    if _empty(value):
+        return {"rich_text": []}
+    return {"rich_text": [{"text": {"content": _text(value)[:TEXT_LIMIT]}}]}
+
+
+def encode_number(value: Any) -> Dict[str, Any]:
+    if isinstance(value, (int, float)):
+        return {"number": value}
+    try:
+        return {"number": float(value)}
+    except (TypeError, ValueError):
+        return {"number": None}
+
+
+def encode_select(value: Any) -> Dict[str, Any]:
+    if _empty(value):
+        return {"select": None}
+    # Option names can't contain commas
+    return {"select": {"name": _text(value).replace(",", "")[:100]}}
+
+
+def encode_multi_select(value: Any) -> Dict[str, Any]:
+    if _empty(value):
+        return {"multi_select": []}
+    if isinstance(value, str):
+        value = [name for name in value.split(", ") if name]
+    names = dict.fromkeys(_name(item).replace(",", "")[:100] for item in value)
+    return {"multi_select": [{"name": name} for name in names]}
+
+
+def encode_date(value: Any) -> Dict[str, Any]:
+    return {"date": {"start": str(value)}} if value else {"date": None}
+
+
+def encode_url(value: Any) -> Dict[str, Any]:
+    return {"url": str(value)} if value else {"url": None}
+
+
+ENCODERS: Dict[str, Callable[[Any], Dict[str, Any] | None]] = {
+    "title": encode_title,
+    "rich_text": encode_rich_text,
+    "number": encode_number,
+    "select": encode_select,
+    "multi_select": encode_multi_select,
+    "date": encode_date,
+    "url": encode_url,
+}
+
+
+class PropertyEncoder:
+    """
+    Turns cleaned records into Notion property values for one database.
+
+    The encoder is compiled once from the database's property schema: each
+    record field is matched to the property of the same normalized name and
+    paired with the encoder for that property's type, and the title field
+    goes to the title property whatever it is called. Fields the database
+    has no property for, or whose property type isn't supported, are left
+    out, so an update only carries what the database can store. Empty
+    values clear their property, except for the title.
+    """
+
+    def __init__(self, schema: Dict[str, Any]) -> None:
+        """
+        :param schema: The "properties" object of a databases.retrieve response.
+        """
+        by_name = {_normalize(name): name for name in schema}
+        self._plan: List[Tuple[str, str, Callable[[Any], Any]]] = []
+        self.title_property: str | None = None
+
+        for field_name in FIELD_NAMES:
+            if field_name == "title":
+                prop_name = next(
+                    (name for name, prop in schema.items() if prop.get("type") == "title"),
+                    None,
+                )
+            else:
+                prop_name = by_name.get(_normalize(field_name))
+            if prop_name is None:
+                if field_name not in IMAGE_FIELDS:
+                    logger.debug("No Notion property for %s", field_name)
+                continue
+
+            prop_type = schema[prop_name].get("type")
+            encoder = ENCODERS.get(prop_type)
+            if encoder is None:
+                logger.warning(
+                    "Notion property %r has unsupported type %s", prop_name, prop_type
+                )
+                continue
+            self._plan.append((field_name, prop_name, encoder))
+            if field_name == "title":
+                self.title_property = prop_name
+
+    @property
+    def properties(self) -> List[str]:
+        """Names of the properties records are written to."""
+        return [prop_name for _, prop_name, _ in self._plan]
+
+    def encode(self, record: Mapping) -> Dict[str, Any]:
+        """Build the properties of a page update from a cleaned record."""
+        properties = {}
+        for field_name, prop_name, encoder in self._plan:
+            encoded = encoder(record.get(field_name))
+            if encoded is not None:
+                properties[prop_name] = encoded
+        return properties
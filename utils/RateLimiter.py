@@ -0,0 +1,208 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Mapping
+
+from .Metrics import RATE_LIMIT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Quota headers, by their lowercase names; servers differ on the prefix
+REMAINING_HEADERS = ("x-ratelimit-remaining", "ratelimit-remaining")
+RESET_HEADERS = ("x-ratelimit-reset", "ratelimit-reset")
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every process using the same API.
+
+    The bucket lives in a row of a SQLite database, and each acquire() is a
+    short write transaction, so concurrent syncs, the watch daemon and
+    one-off lookups draw from one budget instead of each spending the whole
+    rate limit. The bucket refills at the current rate up to burst tokens.
+
+    The rate adapts to the server: a 429 stops everyone until its
+    Retry-After has passed and cuts the rate by decrease, after which it
+    climbs back to the ceiling over recovery seconds. Remaining-quota
+    headers cap the tokens left, and pause the bucket until the reset time
+    once the quota is spent.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float | None = None,
+        path: str = "state/rate_limits.sqlite3",
+        decrease: float = 0.75,
+        recovery: float = 30.0,
+    ) -> None:
+        """
+        :param name: Bucket name; processes using the same name share it.
+        :param rate: Ceiling of requests per second.
+        :param burst: Most requests made back to back; defaults to one second's worth.
+        :param path: Location of the SQLite database holding the buckets.
+        :param decrease: Factor the rate is multiplied by after a 429.
+        :param recovery: Seconds the rate takes to climb back from zero to the ceiling.
+        """
+        self.name = name
+        self.ceiling = rate
+        self.burst = burst or max(1.0, rate)
+        self.decrease = decrease
+        self.recovery = recovery
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Transactions are managed by hand, so each one can take the write lock up front
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                rate REAL NOT NULL,
+                updated REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Wait for a token and take it. Returns the seconds spent waiting."""
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+
+        waited = time.monotonic() - started
+        RATE_LIMIT_WAIT_SECONDS.observe(waited, bucket=self.name)
+        return waited
+
+    def penalize(self, retry_after: float | None = None) -> None:
+        """
+        Record a 429: empty the bucket, pause it for retry_after seconds and
+        cut the rate, for every process sharing it.
+        """
+        with self._transaction() as (tokens, rate, now, blocked_until):
+            rate = max(rate * self.decrease, self.ceiling / 100)
+            blocked_until = max(blocked_until, now + (retry_after or 1.0 / rate))
+            self._store(0.0, rate, now, blocked_until)
+        logger.warning(
+            "%s rate limited, pausing %.2fs at %.2f req/s",
+            self.name,
+            blocked_until - now,
+            rate,
+        )
+
+    def observe(self, headers: Mapping[str, str] | None) -> None:
+        """Take the remaining quota from a response's rate-limit headers, if any."""
+        if not headers:
+            return
+        lowered = {key.lower(): value for key, value in headers.items()}
+        remaining = _header_float(lowered, REMAINING_HEADERS)
+        if remaining is None:
+            return
+        reset = _header_float(lowered, RESET_HEADERS)
+
+        with self._transaction() as (tokens, rate, now, blocked_until):
+            tokens = min(tokens, remaining)
+            if remaining < 1 and reset is not None:
+                # A reset far past now is an epoch timestamp, not a delay
+                reset_at = reset if reset > 1e9 else now + reset
+                blocked_until = max(blocked_until, reset_at)
+            self._store(tokens, rate, now, blocked_until)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _try_acquire(self) -> float:
+        """Take a token if one is free; otherwise return how long to wait."""
+        with self._transaction() as (tokens, rate, now, blocked_until):
+            if now < blocked_until:
+                return blocked_until - now
+            if tokens >= 1:
+                self._store(tokens - 1, rate, now, blocked_until)
+                return 0.0
+            self._store(tokens, rate, now, blocked_until)
+            return (1 - tokens) / rate
+
+    def _transaction(self):
+        return _BucketTransaction(self)
+
+    def _store(self, tokens: float, rate: float, now: float, blocked_until: float):
+        self._conn.execute(
+            "UPDATE buckets SET tokens = ?, rate = ?, updated = ?, blocked_until = ? "
+            "WHERE name = ?",
+            (tokens, rate, now, blocked_until, self.name),
+        )
+
+
+class _BucketTransaction:
+    """
+    Lock the bucket's row and yield its state brought up to date: tokens
+    refilled and the rate recovered for the time since it was last stored.
+    """
+
+    def __init__(self, limiter: RateLimiter) -> None:
+        self.limiter = limiter
+
+    def __enter__(self):
+        limiter = self.limiter
+        limiter._lock.acquire()
+        try:
+            limiter._conn.execute("BEGIN IMMEDIATE")
+            # Wall-clock time, so every process measures elapsed time alike
+            now = time.time()
+            row = limiter._conn.execute(
+                "SELECT tokens, rate, updated, blocked_until FROM buckets WHERE name = ?",
+                (limiter.name,),
+            ).fetchone()
+            if row is None:
+                limiter._conn.execute(
+                    "INSERT INTO buckets (name, tokens, rate, updated) VALUES (?, ?, ?, ?)",
+                    (limiter.name, limiter.burst, limiter.ceiling, now),
+                )
+                return limiter.burst, limiter.ceiling, now, 0.0
+
+            tokens, rate, updated, blocked_until = row
+            elapsed = max(0.0, now - max(updated, min(blocked_until, now)))
+            # Another process may use a different ceiling; this one's applies here
+            rate = min(
+                limiter.ceiling, rate + limiter.ceiling * elapsed / limiter.recovery
+            )
+            tokens = min(limiter.burst, tokens + elapsed * rate)
+            return tokens, rate, now, blocked_until
+        except BaseException:
+            self._end("ROLLBACK")
+            raise
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._end("ROLLBACK" if exc_type else "COMMIT")
+
+    def _end(self, statement: str) -> None:
+        try:
+            if self.limiter._conn.in_transaction:
+                self.limiter._conn.execute(statement)
+        finally:
+            self.limiter._lock.release()
+
+
+def _header_float(headers: Mapping[str, str], names) -> float | None:
+    for name in names:
+        if name in headers:
+            try:
+                return float(headers[name])
+            except ValueError:
+                return None
+    return None
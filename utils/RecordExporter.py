@@ -0,0 +1,205 @@
+import gzip
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .MediaExtractor import movie_spec, tv_spec
+from .TMDBHandler import TMDBHandler
+
+logger = logging.getLogger(__name__)
+
+# Columns describing where a record came from, ahead of the cleaned fields
+SOURCE_COLUMNS = [("page_id", "string"), ("query", "string"), ("tmdb_id", "int")]
+
+# Column types of cleaned fields that aren't strings
+FIELD_TYPES = {
+    "tmdb_rating": "float",
+    "runtime": "int",
+    "episodes": "int",
+    "seasons": "int",
+    "aired_episodes": "int",
+    "genres": "list",
+    "streaming": "list",
+    "watch_free": "list",
+}
+
+
+def _spec_outputs() -> List[str]:
+    """Every field the movie and TV specs can produce, in spec order."""
+    outputs: Dict[str, None] = {}
+    for rule in movie_spec() + tv_spec():
+        for output in (rule.outputs,) if isinstance(rule.outputs, str) else rule.outputs:
+            outputs[output] = None
+    return list(outputs)
+
+
+# Fixed export schema: the same columns in the same order for every record
+SCHEMA: List[Tuple[str, str]] = SOURCE_COLUMNS + [
+    (name, FIELD_TYPES.get(name, "string")) for name in _spec_outputs()
+]
+
+
+def to_row(record: Dict[str, Any], source: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a cleaned record into the export schema, with None for missing fields."""
+    values = {**record, **source}
+    row = {}
+    for name, kind in SCHEMA:
+        value = values.get(name)
+        if kind == "list" and value is not None:
+            # Notion multi-select options become plain names
+            value = [item["name"] if isinstance(item, dict) else item for item in value]
+        row[name] = value
+    return row
+
+
+class JsonLinesExporter:
+    """Append rows to a JSON-lines file, gzipped if the path ends in .gz."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        opener = gzip.open if path.endswith(".gz") else open
+        self._file = opener(self._tmp_path, "wt", encoding="utf-8")
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Close without publishing, removing the partial file."""
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+class ParquetExporter:
+    """
+    Write rows to a Parquet file one row group at a time, so only a batch
+    of rows is ever held in memory. Needs pyarrow.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+
+        types = {
+            "string": pa.string(),
+            "int": pa.int64(),
+            "float": pa.float64(),
+            "list": pa.list_(pa.string()),
+        }
+        self._pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in SCHEMA])
+        self.path = path
+        self.batch_size = batch_size
+        self._tmp_path = f"{path}.tmp"
+        self._writer = pq.ParquetWriter(self._tmp_path, self.schema)
+        self._batch: List[Dict[str, Any]] = []
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._batch:
+            table = self._pa.Table.from_pylist(self._batch, schema=self.schema)
+            self._writer.write_table(table)
+            self._batch = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Close without publishing, removing the partial file."""
+        self._batch = []
+        self._writer.close()
+        os.remove(self._tmp_path)
+
+
+def open_exporter(path: str):
+    """Pick the exporter from the file extension: .parquet, else JSON lines."""
+    if path.endswith(".parquet"):
+        return ParquetExporter(path)
+    return JsonLinesExporter(path)
+
+
+class RecordExport:
+    """
+    Stream cleaned records for a sequence of titles into an exporter.
+
+    Titles are enriched by a pool of workers, but at most a small window of
+    them is in flight, and records are written in input order as soon as
+    the oldest one is done. Memory therefore stays bounded by the window,
+    however many titles are exported.
+
+    A title that has no match or whose requests keep failing is counted as
+    an error and skipped. If the export itself fails, the partial file is
+    removed rather than left behind.
+    """
+
+    def __init__(self, tmdb_handler: TMDBHandler, exporter, workers: int = 8) -> None:
+        self.tmdb_handler = tmdb_handler
+        self.exporter = exporter
+        self.workers = workers
+        self.counts = {"exported": 0, "errors": 0}
+
+    def run(self, entries: Iterable[Tuple[str | None, str]]) -> Dict[str, int]:
+        """Export (page ID, title) pairs and return the counts."""
+        window: deque = deque()
+        executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="export"
+        )
+
+        try:
+            for page_id, title in entries:
+                window.append(executor.submit(self._enrich, page_id, title))
+                if len(window) >= 2 * self.workers:
+                    self._write(window.popleft().result())
+            while window:
+                self._write(window.popleft().result())
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.exporter.abort()
+            raise
+        executor.shutdown(wait=True)
+
+        self.exporter.close()
+        logger.info(
+            "Exported %d records, %d errors",
+            self.counts["exported"],
+            self.counts["errors"],
+        )
+        return self.counts
+
+    def _enrich(self, page_id: str | None, title: str) -> Dict[str, Any] | None:
+        try:
+            tmdb_result = self.tmdb_handler.resolve_title(title)
+            cleaned_data = self.tmdb_handler.fetch_cleaned(tmdb_result)
+        except ValueError as e:
+            logger.error("%s: %s", title, e)
+            return None
+        except Exception as e:
+            # A request that failed for good costs this title, not the export
+            logger.error("%s: %s", title, e, exc_info=e)
+            return None
+
+        source = {"page_id": page_id, "query": title, "tmdb_id": tmdb_result.get("id")}
+        return to_row(cleaned_data, source)
+
+    def _write(self, row: Dict[str, Any] | None) -> None:
+        if row is None:
+            self.counts["errors"] += 1
+            return
+        self.exporter.write(row)
+        self.counts["exported"] += 1
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from .TMDB_API import TMDB_API
+from .TMDBCache import TMDBCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/"
+
+
+def _by_key(key: str, value: str) -> Callable[[Any], Dict[Any, Any]]:
+    """Index a list of objects by one of their fields."""
+
+    def index(items):
+        return {item[key]: item.get(value) for item in items or [] if item.get(key)}
+
+    return index
+
+
+# Table name -> (endpoint, how to fetch it, how to index the response)
+TABLES: Dict[str, Tuple[str, Callable[[TMDB_API], Any], Callable[[Any], Any]]] = {
+    "configuration": (
+        "configuration",
+        lambda api: api.get_configuration(),
+        lambda response: response.get("images", {}),
+    ),
+    "languages": (
+        "configuration/languages",
+        lambda api: api.get_configuration("languages"),
+        _by_key("iso_639_1", "english_name"),
+    ),
+    "countries": (
+        "configuration/countries",
+        lambda api: api.get_configuration("countries"),
+        _by_key("iso_3166_1", "english_name"),
+    ),
+}
+for _media_type in ("movie", "tv"):
+    TABLES[f"{_media_type}_genres"] = (
+        f"genre/{_media_type}/list",
+        lambda api, media_type=_media_type: api.get_genres(media_type),
+        lambda response: _by_key("id", "name")(response.get("genres")),
+    )
+    TABLES[f"{_media_type}_providers"] = (
+        f"watch/providers/{_media_type}",
+        lambda api, media_type=_media_type: api.get_watch_providers(media_type),
+        lambda response: _by_key("provider_id", "provider_name")(response.get("results")),
+    )
+
+
+class ReferenceData:
+    """
+    TMDB's reference lists: image configuration, languages, countries,
+    genres and watch providers.
+
+    Each list is fetched the first time it is needed, stored in the TMDB
+    cache with a TTL of days, and indexed into a dictionary that is kept for
+    the rest of the run, so lookups while cleaning are plain dict reads. If
+    a list can't be fetched, lookups fall back to the raw codes until it is
+    tried again, retry_interval seconds later.
+    """
+
+    def __init__(
+        self,
+        api: TMDB_API,
+        cache: TMDBCache | None = None,
+        retry_interval: float = 60.0,
+    ) -> None:
+        """
+        :param retry_interval: Seconds a list that failed to load is left
+            alone before the next attempt.
+        """
+        self.api = api
+        self.cache = cache
+        self.retry_interval = retry_interval
+        self._tables: Dict[str, Any] = {}
+        # Table name -> monotonic time after which a failed load is retried
+        self._retry_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> Any:
+        """Return an indexed reference list, loading it on first use."""
+        table = self._tables.get(name)
+        if table is not None:
+            return table
+
+        with self._lock:
+            if name in self._tables:
+                return self._tables[name]
+            if time.monotonic() < self._retry_at.get(name, 0.0):
+                return {}
+            table = self._load(name)
+            if table is None:
+                self._retry_at[name] = time.monotonic() + self.retry_interval
+                return {}
+            self._retry_at.pop(name, None)
+            self._tables[name] = table
+        return table
+
+    def _load(self, name: str) -> Any:
+        """Fetch and index a list, or return None if it can't be had."""
+        endpoint, fetch, index = TABLES[name]
+
+        response = self.cache.get(endpoint) if self.cache else None
+        if response is None:
+            try:
+                response = fetch(self.api)
+                if self.cache:
+                    self.cache.set(endpoint, None, (), None, response)
+                logger.info("Fetched TMDB reference list %s", endpoint)
+            except Exception:
+                response = (
+                    self.cache.get(endpoint, allow_stale=True) if self.cache else None
+                )
+                if response is None:
+                    logger.warning("Couldn't load TMDB %s", endpoint, exc_info=True)
+                    return None
+
+        return index(response)
+
+    def language_name(self, code: str | None) -> str | None:
+        """English name of an ISO 639-1 language code, e.g. "ko" -> "Korean"."""
+        if not code:
+            return None
+        return self.table("languages").get(code) or code
+
+    def country_name(self, code: str | None) -> str | None:
+        """English name of an ISO 3166-1 country code, e.g. "KR" -> "South Korea"."""
+        if not code:
+            return None
+        return self.table("countries").get(code) or code
+
+    def genre_name(self, media_type: str, genre_id: int) -> str | None:
+        return self.table(f"{media_type}_genres").get(genre_id)
+
+    def provider_name(self, media_type: str, provider_id: int) -> str | None:
+        return self.table(f"{media_type}_providers").get(provider_id)
+
+    def image_base_url(self, size: str = "original") -> str:
+        """Base URL of images of the given size, e.g. for poster paths."""
+        images = self.table("configuration")
+        base_url = images.get("secure_base_url") or DEFAULT_IMAGE_BASE_URL
+        if images.get("poster_sizes") and size not in (
+            images.get("poster_sizes", []) + images.get("backdrop_sizes", [])
+        ):
+            size = "original"
+        return f"{base_url}{size}"
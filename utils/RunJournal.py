@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, NamedTuple
+
+from .MediaRecord import MediaRecord
+
+logger = logging.getLogger(__name__)
+
+
+class JournalEntry(NamedTuple):
+    stage: str
+    title: str | None = None
+    tmdb_result: Dict[str, Any] | None = None
+    cleaned: MediaRecord | None = None
+
+
+class RunJournal:
+    """
+    Append-only checkpoint journal of the pages a sync run has processed.
+
+    Every stage a page reaches (resolved, cleaned, written) is
+    appended as a JSON line together with what a restarted run needs to
+    pick up from there: the chosen TMDB result and the cleaned record.
+    Fetched details aren't journaled, as the TMDB cache already keeps them.
+    Lines are flushed as they are written, so a crashed run loses at most
+    the line being written, and a torn last line is ignored on load.
+    """
+
+    def __init__(self, path: str = "state/run_journal.jsonl") -> None:
+        self.path = path
+        self.entries: Dict[str, JournalEntry] = {}
+        self._lock = threading.Lock()
+
+        torn = False
+        if os.path.exists(path):
+            torn = self._replay()
+            if self.entries:
+                logger.info("Resuming from journal with %d page(s)", len(self.entries))
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            # End the torn line so the next record starts on a line of its own
+            self._file.write("\n")
+
+    def _replay(self) -> bool:
+        """Load the journal. Returns whether its last line is unterminated."""
+        line = ""
+        with open(self.path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Ignoring a torn line in %s", self.path)
+                    continue
+
+                self._apply(record)
+        return bool(line) and not line.endswith("\n")
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        """
+        Fold a journal line into the page's entry. A line with a title starts
+        the page over; later stages only carry what they added.
+        """
+        previous = self.entries.get(record["page_id"])
+        values = {} if previous is None or "title" in record else previous._asdict()
+        values.update(
+            (key, value) for key, value in record.items() if key in JournalEntry._fields
+        )
+        if isinstance(values.get("cleaned"), dict):
+            values["cleaned"] = MediaRecord.from_dict(values["cleaned"])
+        self.entries[record["page_id"]] = JournalEntry(**values)
+
+    def get(self, page_id: str, title: str) -> JournalEntry | None:
+        """Return a page's last stage, unless its title changed since."""
+        with self._lock:
+            entry = self.entries.get(page_id)
+        if entry is None or entry.title != title:
+            return None
+        return entry
+
+    def record(
+        self,
+        page_id: str,
+        stage: str,
+        title: str | None = None,
+        tmdb_result: Dict[str, Any] | None = None,
+        cleaned: MediaRecord | None = None,
+    ) -> None:
+        """Append a page's new stage, with any result it produced."""
+        record = {"page_id": page_id, "stage": stage}
+        if title is not None:
+            record["title"] = title
+        if tmdb_result is not None:
+            record["tmdb_result"] = tmdb_result
+        if cleaned is not None:
+            record["cleaned"] = cleaned
+
+        line = json.dumps(
+            {**record, "cleaned": dict(cleaned)} if cleaned is not None else record,
+            default=str,
+        )
+        with self._lock:
+            self._apply(record)
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def on_write(self, write_result) -> None:
+        """Write queue listener marking successfully written pages."""
+        if write_result.success:
+            self.record(write_result.page_id, "written")
+
+    def sync(self) -> None:
+        """Make everything recorded so far durable on disk."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def clear(self) -> None:
+        """Forget every page, once a run has finished without failures."""
+        with self._lock:
+            self.entries.clear()
+            self._file.truncate(0)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,141 @@
+import math
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+# Title markers, e.g. "Parasite[m2019" => movie released in 2019
+MARKER_PATTERN = re.compile(r"^(?P<title>.*?)\s*\[(?P<type>[mt])?(?P<year>\d{4})?\s*$")
+MARKER_TYPES = {"m": "movie", "t": "tv"}
+
+_ARTICLES = re.compile(r"^(the|a|an) ")
+_NON_ALPHANUMERIC = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class TitleQuery(NamedTuple):
+    title: str
+    media_type: str | None = None
+    year: int | None = None
+
+
+class RankedResult(NamedTuple):
+    score: float
+    result: Dict[str, Any]
+
+
+def parse_title(text: str) -> TitleQuery:
+    """
+    Split a Notion title into the search title and its optional markers.
+    "Parasite[m2019" searches movies from 2019, "Severance[t" only TV shows.
+    """
+    match = MARKER_PATTERN.match(text.strip())
+    if not match:
+        return TitleQuery(text.strip())
+
+    marker_type, year = match.group("type"), match.group("year")
+    return TitleQuery(
+        match.group("title"),
+        MARKER_TYPES.get(marker_type) if marker_type else None,
+        int(year) if year else None,
+    )
+
+
+def normalize_title(title: str) -> str:
+    """Lower-case, strip accents, punctuation and leading articles."""
+    title = unicodedata.normalize("NFKD", title)
+    title = "".join(char for char in title if not unicodedata.combining(char))
+    title = _NON_ALPHANUMERIC.sub(" ", title.casefold())
+    title = _WHITESPACE.sub(" ", title).strip()
+    return _ARTICLES.sub("", title)
+
+
+def _result_year(result: Dict[str, Any]) -> int | None:
+    date = result.get("release_date") or result.get("first_air_date") or ""
+    return int(date[:4]) if date[:4].isdigit() else None
+
+
+class SearchRanker:
+    """
+    Rank TMDB search results against the title that was searched for.
+
+    Each candidate is scored on normalized title similarity (against both
+    its display and original title), how close its year is to the requested
+    one, and its popularity, which mostly serves to break ties.
+    """
+
+    def __init__(
+        self,
+        title_weight: float = 0.7,
+        year_weight: float = 0.2,
+        popularity_weight: float = 0.1,
+        min_confidence: float = 0.6,
+    ) -> None:
+        self.title_weight = title_weight
+        self.year_weight = year_weight
+        self.popularity_weight = popularity_weight
+        self.min_confidence = min_confidence
+
+    def rank(self, query: TitleQuery, results: List[Dict[str, Any]]) -> List[RankedResult]:
+        """Return the movie and TV results, best match first."""
+        wanted = normalize_title(query.title)
+        candidates = [
+            result
+            for result in results
+            if result.get("media_type") in ("movie", "tv")
+            and (query.media_type is None or result["media_type"] == query.media_type)
+        ]
+        if not candidates:
+            return []
+
+        max_popularity = max(result.get("popularity") or 0 for result in candidates)
+        ranked = [
+            RankedResult(self._score(wanted, query.year, result, max_popularity), result)
+            for result in candidates
+        ]
+        ranked.sort(key=lambda ranked_result: ranked_result.score, reverse=True)
+        return ranked
+
+    def _score(
+        self,
+        wanted: str,
+        year: int | None,
+        result: Dict[str, Any],
+        max_popularity: float,
+    ) -> float:
+        titles = {
+            result.get("title") or result.get("name") or "",
+            result.get("original_title") or result.get("original_name") or "",
+        }
+        similarity = max(
+            SequenceMatcher(None, wanted, normalize_title(title)).ratio()
+            for title in titles
+        )
+
+        # Without a requested year every result counts as matching it
+        year_score = 1.0
+        if year is not None:
+            result_year = _result_year(result)
+            year_score = (
+                0.0 if result_year is None else max(0.0, 1 - abs(result_year - year) / 3)
+            )
+
+        popularity = result.get("popularity") or 0
+        popularity_score = (
+            math.log1p(popularity) / math.log1p(max_popularity) if max_popularity else 0.0
+        )
+
+        return (
+            self.title_weight * similarity
+            + self.year_weight * year_score
+            + self.popularity_weight * popularity_score
+        )
+
+    def best(
+        self, query: TitleQuery, results: List[Dict[str, Any]]
+    ) -> Tuple[RankedResult | None, bool]:
+        """Return the top-ranked result and whether it is confident enough to use."""
+        ranked = self.rank(query, results)
+        if not ranked:
+            return None, False
+        return ranked[0], ranked[0].score >= self.min_confidence
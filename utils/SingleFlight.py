@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple, Type
+
+from .Metrics import COALESCED_CALLS
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Run a call once per key and share its outcome.
+
+    Callers asking for a key that is in flight wait for the first call
+    instead of repeating it. Up to keep finished outcomes are also kept,
+    least recently used first out, so later callers get them too until
+    they are forgotten or clear() is called. A failure is shared with the
+    callers already waiting but not kept, so the next caller tries again,
+    unless it is one of the keep_errors, i.e. an outcome that trying again
+    wouldn't change.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        keep_errors: Tuple[Type[BaseException], ...] = (),
+        keep: int = 0,
+    ) -> None:
+        self.name = name
+        self.keep_errors = keep_errors
+        self.keep = keep
+        self._in_flight: Dict[Hashable, _Call] = {}
+        self._kept: OrderedDict[Hashable, _Call] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._kept.get(key)
+            if call is not None:
+                self._kept.move_to_end(key)
+            else:
+                call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+
+        if leader:
+            try:
+                call.result = func(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                self._finish(key, call)
+        else:
+            COALESCED_CALLS.inc(call=self.name)
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _finish(self, key: Hashable, call: _Call) -> None:
+        with self._lock:
+            # A key forgotten while in flight isn't kept
+            if self._in_flight.get(key) is call:
+                del self._in_flight[key]
+                if self.keep and (
+                    call.error is None or isinstance(call.error, self.keep_errors)
+                ):
+                    self._kept[key] = call
+                    while len(self._kept) > self.keep:
+                        self._kept.popitem(last=False)
+        call.done.set()
+
+    def forget(self, key: Hashable) -> None:
+        """Drop a key's kept outcome, and keep the one in flight from being kept."""
+        with self._lock:
+            self._kept.pop(key, None)
+            self._in_flight.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget kept results, e.g. between the polls of a long-running process."""
+        with self._lock:
+            self._kept.clear()
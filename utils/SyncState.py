@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date
+from typing import Any, Dict, Iterator, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SyncState:
+    """
+    Persistent record of what has been synced to Notion.
+
+    Holds the last-sync watermark (the date the last refresh started), the
+    watch daemon's high-water mark of Notion edit times, the TMDB media each
+    Notion page is linked to and digests of the values last written to each
+    page, stored in a SQLite database.
+
+    Everything is loaded into memory when the state is opened. A save writes
+    only the pages linked or written since the previous one, in a single
+    transaction, so its cost doesn't grow with the size of the database and
+    processes sharing the file don't overwrite each other's pages.
+    """
+
+    def __init__(self, path: str = "state/sync_state.sqlite3") -> None:
+        """
+        :param path: Location of the SQLite database file. A JSON state file
+            next to it, as written by earlier versions, is imported once.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # Serialises use of the connection, which saves share across threads
+        self._save_lock = threading.Lock()
+        self.watermark: date | None = None
+        self.edited_mark: str | None = None
+        self.links: Dict[str, Tuple[str, int]] = {}
+        self.digests: Dict[str, Dict[str, str]] = {}
+        # Pages linked or written since the last save
+        self._dirty_links: Set[str] = set()
+        self._dirty_digests: Set[str] = set()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS marks (name TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS links (
+                    page_id TEXT PRIMARY KEY,
+                    media_type TEXT NOT NULL,
+                    tmdb_id INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS digests"
+                " (page_id TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+        marks = dict(self._conn.execute("SELECT name, value FROM marks"))
+        if marks:
+            if marks.get("watermark"):
+                self.watermark = date.fromisoformat(marks["watermark"])
+            self.edited_mark = marks.get("edited_mark")
+            self.links = {
+                page_id: (media_type, tmdb_id)
+                for page_id, media_type, tmdb_id in self._conn.execute(
+                    "SELECT page_id, media_type, tmdb_id FROM links"
+                )
+            }
+            self.digests = {
+                page_id: json.loads(value)
+                for page_id, value in self._conn.execute(
+                    "SELECT page_id, value FROM digests"
+                )
+            }
+        else:
+            self._import_json(f"{os.path.splitext(path)[0]}.json")
+
+    def _import_json(self, json_path: str) -> None:
+        """Take over a JSON state file from an earlier version, if there is one."""
+        if not os.path.exists(json_path):
+            return
+        with open(json_path, "r") as json_file:
+            data = json.load(json_file)
+        if data.get("watermark"):
+            self.watermark = date.fromisoformat(data["watermark"])
+        self.edited_mark = data.get("edited_mark")
+        self.links = {
+            page_id: (link[0], link[1])
+            for page_id, link in data.get("links", {}).items()
+        }
+        self.digests = data.get("digests", {})
+        self._dirty_links = set(self.links)
+        self._dirty_digests = set(self.digests)
+        self.save()
+        logger.info("Imported sync state from %s", json_path)
+
+    def link(self, page_id: str, tmdb_result: Dict[str, Any]) -> None:
+        """Remember which TMDB movie or TV show a page was filled from."""
+        with self._lock:
+            self.links[page_id] = (tmdb_result["media_type"], tmdb_result["id"])
+            self._dirty_links.add(page_id)
+
+    def written_digests(self, page_id: str) -> Dict[str, str]:
+        """Return the digests of the values last written to a page."""
+        with self._lock:
+            return dict(self.digests.get(page_id, {}))
+
+    def record_written(self, page_id: str, digests: Dict[str, str]) -> None:
+        """Remember the digests of values successfully written to a page."""
+        with self._lock:
+            self.digests[page_id] = {**self.digests.get(page_id, {}), **digests}
+            self._dirty_digests.add(page_id)
+
+    def pages_for(self, media_type: str) -> Iterator[Tuple[str, int]]:
+        """Yield (page ID, TMDB ID) for every page linked to the media type."""
+        with self._lock:
+            links = list(self.links.items())
+        for page_id, (linked_type, tmdb_id) in links:
+            if linked_type == media_type:
+                yield page_id, tmdb_id
+
+    def save(self) -> None:
+        """Write the marks and the pages changed since the last save to disk."""
+        with self._lock:
+            marks = [
+                ("watermark", self.watermark.isoformat() if self.watermark else None),
+                ("edited_mark", self.edited_mark),
+            ]
+            links = [(page_id, *self.links[page_id]) for page_id in self._dirty_links]
+            digests = [
+                (page_id, json.dumps(self.digests[page_id]))
+                for page_id in self._dirty_digests
+            ]
+            self._dirty_links = set()
+            self._dirty_digests = set()
+
+        try:
+            with self._save_lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO marks (name, value) VALUES (?, ?)", marks
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO links (page_id, media_type, tmdb_id)"
+                    " VALUES (?, ?, ?)",
+                    links,
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO digests (page_id, value) VALUES (?, ?)",
+                    digests,
+                )
+        except sqlite3.Error:
+            # Keep the pages for the next save
+            with self._lock:
+                self._dirty_links.update(page_id for page_id, *_ in links)
+                self._dirty_digests.update(page_id for page_id, _ in digests)
+            raise
+
+    def close(self) -> None:
+        with self._save_lock:
+            self._conn.close()
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Tuple
+
+from .Metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+class TMDBCache:
+    """
+    SQLite-backed cache for TMDB responses.
+
+    Entries are keyed by endpoint, media ID, the set of appended resources and
+    any query parameters. Each resource has its own TTL; a response made of
+    several appended resources expires as soon as its most volatile part does.
+    Expired entries are kept around so they can still be served if a refetch
+    fails, until size-based eviction removes the least recently used ones.
+    """
+
+    # Seconds each resource stays fresh. Keys are endpoints or append names.
+    DEFAULT_TTLS = {
+        "authentication": 1 * DAY,
+        "search": 1 * DAY,
+        "movie": 7 * DAY,
+        "tv": 1 * DAY,
+        "credits": 30 * DAY,
+        "release_dates": 14 * DAY,
+        "content_ratings": 14 * DAY,
+        "videos": 7 * DAY,
+        "watch/providers": 12 * HOUR,
+        # Reference lists: configuration/..., genre/.../list, watch/providers/...
+        "configuration": 7 * DAY,
+        "genre": 7 * DAY,
+        "watch": 1 * DAY,
+    }
+    DEFAULT_TTL = 1 * DAY
+
+    def __init__(
+        self,
+        path: str = "cache/tmdb_cache.sqlite3",
+        ttls: Dict[str, int] | None = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        bypass: bool = False,
+        refresh: bool = False,
+    ) -> None:
+        """
+        :param path: Location of the SQLite database file.
+        :param ttls: Overrides for DEFAULT_TTLS.
+        :param max_bytes: Total size of stored (compressed) responses to keep.
+        :param bypass: Neither read from nor write to the cache.
+        :param refresh: Ignore cached responses, but store fresh ones.
+        """
+        self.path = path
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.refresh = refresh
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                media_id TEXT,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        endpoint: str,
+        media_id: Any = None,
+        append: Iterable[str] = (),
+        params: Dict[str, Any] | None = None,
+    ) -> str:
+        """Build a stable cache key; append order and param order don't matter."""
+        return json.dumps(
+            [
+                endpoint,
+                None if media_id is None else str(media_id),
+                sorted(append),
+                sorted((params or {}).items()),
+            ],
+            separators=(",", ":"),
+        )
+
+    def ttl_for(self, endpoint: str, append: Iterable[str] = ()) -> int:
+        """Return the TTL of a response, i.e. that of its most volatile part."""
+        base = endpoint.split("/")[0]
+        ttls = [self.ttls.get(base, self.DEFAULT_TTL)]
+        ttls.extend(self.ttls.get(name, self.DEFAULT_TTL) for name in append)
+        return min(ttls)
+
+    def get(
+        self,
+        endpoint: str,
+        media_id: Any = None,
+        append: Iterable[str] = (),
+        params: Dict[str, Any] | None = None,
+        allow_stale: bool = False,
+    ) -> Any | None:
+        """
+        Return the cached response, or None on a miss. Expired responses are
+        only returned when allow_stale is set (e.g. after a failed refetch).
+        """
+        if self.bypass or (self.refresh and not allow_stale):
+            return None
+
+        key = self.make_key(endpoint, media_id, append, params)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] <= now and not allow_stale):
+                # Stale lookups follow a miss that was already counted
+                if not allow_stale:
+                    record_cache_lookup("miss")
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+
+        record_cache_lookup("hit" if row[1] > now else "stale")
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(
+        self,
+        endpoint: str,
+        media_id: Any,
+        append: Iterable[str],
+        params: Dict[str, Any] | None,
+        value: Any,
+    ) -> None:
+        """Store a response, then evict old entries if over the size limit."""
+        if self.bypass:
+            return
+
+        append = tuple(append)
+        key = self.make_key(endpoint, media_id, append, params)
+        blob = zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+        now = time.time()
+        expires_at = now + self.ttl_for(endpoint, append)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    endpoint,
+                    None if media_id is None else str(media_id),
+                    blob,
+                    len(blob),
+                    now,
+                    expires_at,
+                    now,
+                ),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def invalidate(self, endpoint: str, media_id: Any) -> None:
+        """Drop every cached response for a media item, whatever was appended."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM responses WHERE endpoint = ? AND media_id = ?",
+                (endpoint, str(media_id)),
+            )
+            self._conn.commit()
+
+    def stats(self) -> Tuple[int, int]:
+        """Return the number of stored responses and their total size in bytes."""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return count, size
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until under 90% of max_bytes."""
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        keys = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ):
+            keys.append((key,))
+            freed += size
+            if freed >= target:
+                break
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+        logger.info("Evicted %d cached TMDB response(s)", len(keys))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
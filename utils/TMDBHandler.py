@@ -1,312 +1,424 @@
+import hashlib
 import logging
-from typing import Any, Dict, List
-
-import TMDB_API
-import tmdbsimple
-from tmdbsimple import TV, Movies, Search
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),  # Logs to console
-        logging.FileHandler("logs/notion.log"),  # Logs to a file
-    ],
-)
+from datetime import date, timedelta
+from typing import Any, Dict, List, Set
+
+from results_exceptions import LowConfidenceMatchException
+
+from .MediaExtractor import MOVIE_SPEC, TV_SPEC, MediaExtractor, movie_spec, tv_spec
+from .MediaRecord import MediaRecord
+from .Metrics import timed_stage
+from .ReferenceData import ReferenceData
+from .SearchRanker import SearchRanker, TitleQuery, parse_title
+from .SingleFlight import SingleFlight
+from .TMDB_API import TMDB_API
+from .TMDBCache import TMDBCache
+from .TitleIndex import TitleIndex
 
 # Initialize a logger for the module
 logger = logging.getLogger(__name__)
 
+# Resources appended to every details request, per media type
+DETAILS_APPEND = {
+    "movie": ("watch/providers", "credits", "release_dates", "videos"),
+    "tv": ("watch/providers", "credits", "content_ratings", "videos", "external_ids"),
+}
 
-class TMDBHandler:
-    def __init__(self, api_key: str | None) -> None:
-        tmdbsimple.API_KEY = api_key
+# Most sub-requests TMDB accepts in one append_to_response
+APPEND_LIMIT = 20
 
-        try:
-            # Attempt a test search to verify the API key is valid
-            test_search = Search()
-            test_search.multi(query="test")
-            logger.info("TMDBHandler initialized successfully with API key.")
-        except Exception as e:
-            logger.critical("Failed to set API key for TMDBHandler", exc_info=True)
-            raise ValueError("Invalid API key for TMDBHandler.") from e
+# Episode fields kept from appended season details
+EPISODE_FIELDS = ("season_number", "episode_number", "name", "air_date", "runtime")
+
+# Extractors are compiled once and shared by every handler
+EXTRACTORS = {
+    "movie": MediaExtractor(MOVIE_SPEC),
+    "tv": MediaExtractor(TV_SPEC),
+}
+
+# Year filter parameter of the typed search endpoints
+SEARCH_YEAR_PARAMS = {"movie": "primary_release_year", "tv": "first_air_date_year"}
+
+# Longest date range the change feeds accept in one query
+CHANGES_MAX_DAYS = 14
+
+# Resolutions and cleaned records kept for duplicates arriving later; raw
+# details are never kept, so memory stays flat however many titles a run has.
+# A duplicate that gets a kept record makes no details request.
+RESOLVED_KEEP = 4096
+CLEANED_KEEP = 1024
+
+# Most popular title index matches ranked alongside the search results
+INDEX_CANDIDATES = 5
 
-    def search_media(self, title: str):
+
+class TMDBHandler:
+    def __init__(
+        self,
+        api_key: str | None,
+        cache: TMDBCache | None = None,
+        api: TMDB_API | None = None,
+        ranker: SearchRanker | None = None,
+        title_index: TitleIndex | None = None,
+        reference: ReferenceData | None = None,
+        dedupe: bool = True,
+    ) -> None:
+        """
+        :param reference: TMDB's reference lists; with them, language and
+            country codes are cleaned into names.
+        :param dedupe: Share the search of a title, and the cleaned record of
+            a TMDB ID (see fetch_cleaned), between every entry asking for it
+            (see reset_dedupe). Both are kept for the most recent titles.
+        """
+        self.api_key = api_key
+        self.api = api or TMDB_API(api_key)
+        self.cache = cache
+        self.ranker = ranker or SearchRanker()
+        self.title_index = title_index
+        self.reference = reference
+        self.extractors = EXTRACTORS
+        if reference is not None:
+            self.extractors = {
+                "movie": MediaExtractor(movie_spec(reference)),
+                "tv": MediaExtractor(tv_spec(reference)),
+            }
+        self._key_verified = False
+        self.dedupe = dedupe
+        # Titles without a (confident) match won't get one by searching again
+        self._resolved = SingleFlight(
+            "resolve", keep_errors=(ValueError,), keep=RESOLVED_KEEP
+        )
+        # Details are fetched and cleaned in one step, and only the much
+        # smaller cleaned record is kept, never the raw details
+        self._cleaned = SingleFlight("details", keep=CLEANED_KEEP)
+
+    def verify_api_key(self) -> None:
+        """
+        Check that the API key works, raising ValueError if it doesn't.
+        A successful check is remembered, in the cache when there is one.
+        """
+        if self._key_verified:
+            return
+
+        # Key the cached check on a hash so the key itself is never stored
+        params = {"key": hashlib.sha256(str(self.api_key).encode()).hexdigest()}
+        if self.cache and self.cache.get("authentication", params=params):
+            self._key_verified = True
+            return
+
+        if not self.api.authenticate():
+            logger.critical("Failed to verify API key for TMDBHandler")
+            raise ValueError("Invalid API key for TMDBHandler.")
+        logger.info("TMDBHandler API key verified successfully.")
+
+        self._key_verified = True
+        if self.cache:
+            self.cache.set("authentication", None, (), params, True)
+
+    @timed_stage("search")
+    def search_media(
+        self, title: str, media_type: str | None = None, year: int | None = None
+    ):
         """
         Search TMDb for a given title, which could be a movie or TV show.
-        Returns a list of search results.
+        With a media type, only that type is searched, optionally filtered by
+        year. Returns a list of search results, each with its media_type.
         """
+        kind = media_type or "multi"
+        endpoint = f"search/{kind}"
+        params: Dict[str, Any] = {"query": title}
+        if media_type and year:
+            params[SEARCH_YEAR_PARAMS[media_type]] = year
+
+        if self.cache:
+            cached = self.cache.get(endpoint, params=params)
+            if cached is not None:
+                logger.debug("Cache hit for search: '%s'", title)
+                return self._typed_results(cached, media_type)
+
         try:
-            search = Search()
-            response = search.multi(query=title)
-            results = response.get("results", [])
+            extra = {key: value for key, value in params.items() if key != "query"}
+            response = self.api.search(kind, title, **extra)
+            if self.cache:
+                self.cache.set(endpoint, None, (), params, response)
+            results = self._typed_results(response, media_type)
             if not results:
-                logger.warning(f"No results found for title: '{title}'")
+                logger.warning("No results found for title: '%s'", title)
             else:
-                logger.info(f"Found {len(results)} result(s) for title: '{title}'")
+                logger.info("Found %d result(s) for title: '%s'", len(results), title)
             return results
         except Exception as e:
-            logger.error(f"Error searching for title '{title}': {e}", exc_info=True)
+            stale = (
+                self.cache.get(endpoint, params=params, allow_stale=True)
+                if self.cache
+                else None
+            )
+            if stale is not None:
+                logger.warning("Serving stale search results for '%s': %s", title, e)
+                return self._typed_results(stale, media_type)
+            logger.error("Error searching for title '%s': %s", title, e, exc_info=True)
             raise
 
-    # FIXME This only works with movies right now
-    def fetch_media_details(self, tmdb_result):
+    @staticmethod
+    def _typed_results(response, media_type: str | None) -> List[Dict[str, Any]]:
+        """Search results, tagged with their media type for typed searches."""
+        results = response.get("results", [])
+        if media_type:
+            results = [{**result, "media_type": media_type} for result in results]
+        return results
+
+    def reset_dedupe(self) -> None:
+        """Forget shared results, so later entries search and fetch afresh."""
+        for flight in (self._resolved, self._cleaned):
+            flight.clear()
+
+    @staticmethod
+    def title_key(title: str):
+        """
+        Key under which identical titles share one resolution. Only case and
+        whitespace are ignored: "The Heat" and "Heat" are different films.
+        """
+        query = parse_title(title)
+        return " ".join(query.title.casefold().split()), query.media_type, query.year
+
+    def fetch_cleaned(self, tmdb_result, refresh: bool = False) -> MediaRecord:
+        """
+        Fetch a search result's details and clean them, as one step. Every
+        entry with the same TMDB ID, at the same time or later in the run,
+        shares the cleaned record, so duplicates make no details request.
+        With refresh set, the kept record and cached details are replaced.
+        """
+        media_type = tmdb_result.get("media_type")
+        if not self.dedupe:
+            return self._fetch_cleaned(tmdb_result, refresh)
+        key = (media_type, tmdb_result.get("id"))
+        if refresh:
+            self._cleaned.forget(key)
+        return self._cleaned.do(key, self._fetch_cleaned, tmdb_result, refresh)
+
+    def _fetch_cleaned(self, tmdb_result, refresh: bool = False) -> MediaRecord:
+        raw_data = self.fetch_media_details(tmdb_result, refresh)
+        return self.clean_media_data(raw_data, tmdb_result.get("media_type"))
+
+    @timed_stage("details")
+    def fetch_media_details(self, tmdb_result, refresh: bool = False):
         """
         Fetch detailed data for a specific media item, whether it's a movie or TV show.
+        With refresh set, cached details are ignored and replaced. Nothing is
+        shared between calls; see fetch_cleaned.
         """
         try:
             media_type = tmdb_result.get("media_type")
             media_id = tmdb_result.get("id")
 
-            if media_type == "movie":
-                media = Movies(media_id)
-            elif media_type == "tv":
-                media = TV(media_id)
-            else:
+            if media_type not in DETAILS_APPEND:
                 raise ValueError(f"Unsupported media type: {media_type}")
-
-            raw_data = media.info(
-                append_to_response=["watch/providers,credits,release_dates,videos"]
-            )
-            logger.info(f"Fetched details for {media_type} with ID {media_id}")
+            append = DETAILS_APPEND[media_type]
+            if media_type == "tv":
+                # Cached TV details include their seasons
+                append = append + ("seasons",)
+
+            if self.cache and not refresh:
+                cached = self.cache.get(media_type, media_id, append)
+                if cached is not None:
+                    logger.debug("Cache hit for %s with ID %s", media_type, media_id)
+                    return cached
+
+            try:
+                if media_type == "tv":
+                    raw_data = self._get_tv_details(media_id)
+                else:
+                    raw_data = self.api.get_details(media_type, media_id, append)
+            except Exception:
+                stale = (
+                    self.cache.get(media_type, media_id, append, allow_stale=True)
+                    if self.cache
+                    else None
+                )
+                if stale is None:
+                    raise
+                logger.warning("Serving stale details for %s %s", media_type, media_id)
+                return stale
+
+            if self.cache:
+                self.cache.set(media_type, media_id, append, None, raw_data)
+            logger.info("Fetched details for %s with ID %s", media_type, media_id)
             return raw_data
 
         except ValueError as e:
-            logger.error(f"Error with media type: {media_type}", exc_info=True)
+            logger.error("Error with media type: %s", media_type, exc_info=True)
         except AttributeError as e:
-            logger.error(f"Error with tmdb result: {tmdb_result}", exc_info=True)
+            logger.error("Error with tmdb result: %s", tmdb_result, exc_info=True)
             raise
         except Exception as e:
-            logger.error(f"Error fetching info for media ID {media_id}", exc_info=True)
+            logger.error("Error fetching info for media ID %s", media_id, exc_info=True)
             raise
 
+    def _get_tv_details(self, media_id) -> Dict[str, Any]:
+        """
+        Fetch a TV show's details with every season's episodes, packing the
+        season sub-requests into as few append_to_response calls as
+        possible. The first call fills its spare appends with the first
+        seasons, so most shows take a single request and a 30-season show two.
+        """
+        append = DETAILS_APPEND["tv"]
+        spare = APPEND_LIMIT - len(append)
+        first_seasons = [f"season/{number}" for number in range(1, spare + 1)]
+        raw_data = self.api.get_details("tv", media_id, append + tuple(first_seasons))
+
+        # Specials (season 0) aren't part of the episode counts
+        missing = [
+            f"season/{season['season_number']}"
+            for season in raw_data.get("seasons") or []
+            if season.get("season_number")
+            and f"season/{season['season_number']}" not in raw_data
+        ]
+        for start in range(0, len(missing), APPEND_LIMIT):
+            chunk = missing[start : start + APPEND_LIMIT]
+            response = self.api.get_details("tv", media_id, chunk)
+            raw_data.update((key, response[key]) for key in chunk if key in response)
+
+        # Only the episode fields the cleaner reads are kept (and cached)
+        for key in list(raw_data):
+            if key.startswith("season/"):
+                raw_data[key] = {
+                    "season_number": raw_data[key].get("season_number"),
+                    "episodes": [
+                        {field: episode.get(field) for field in EPISODE_FIELDS}
+                        for episode in raw_data[key].get("episodes") or []
+                    ],
+                }
+        return raw_data
+
+    @timed_stage("clean")
     def clean_media_data(self, tmdb_data, media_type):
-        # Extract and format desired TMDb fields
-
-        cleaned_data = {}
-        if media_type == "movie":
-
-            # US title
-            tmdb_data["title"] = tmdb_data.pop("title", None)
-
-            # Media type
-            tmdb_data["type"] = media_type.capitalize()
-
-            # Tagline
-            tmdb_data["tagline"] = tmdb_data.pop("tagline", None)
-
-            # TMDB rating
-            if tmdb_data.get("vote_average"):
-                tmdb_data["tmdb_rating"] = round(tmdb_data.pop("vote_average"), 1)
-            else:
-                tmdb_data["tmdb_rating"] = None
-
-            # Directors & producers
-            for member in tmdb_data["credits"]["crew"]:
-                if member["job"] == "Director":
-                    tmdb_data.setdefault("directors", []).append(member["name"])
-                elif member["job"] == "Producer":
-                    tmdb_data.setdefault("producers", []).append(member["name"])
-
-            tmdb_data["directors"] = ", ".join(tmdb_data.get("directors"))
-            tmdb_data["producers"] = ", ".join(tmdb_data.get("producers"))
-
-            # Genres
-            tmdb_data["genres"] = [
-                {"name": genre["name"]} for genre in tmdb_data.get("genres", [])
-            ]
-
-            # Runtime
-            tmdb_data["runtime"] = tmdb_data.pop("runtime", None)
-
-            # Streaming providers
-            for provider in (
-                tmdb_data.get("watch/providers", {})
-                .get("results", {})
-                .get("US", {})
-                .get("flatrate", [])
-            ):
-                if provider:
-                    tmdb_data["streaming"] = [
-                        {"name": provider["provider_name"]}
-                        for provider in tmdb_data.get("watch/providers", {})
-                        .get("results", {})
-                        .get("US", {})
-                        .get("flatrate", [])
-                    ]
-
-            # Watch free
-            for provider in (
-                tmdb_data.get("watch/providers", {})
-                .get("results", {})
-                .get("US", {})
-                .get("free", [])
-            ):
-                if provider:
-                    tmdb_data["watch_free"] = [
-                        {"name": provider["provider_name"]}
-                        for provider in tmdb_data.get("watch/providers", {})
-                        .get("results", {})
-                        .get("US", {})
-                        .get("free", [])
-                    ]
-
-            # Official trailer
-            # TODO Prioritize official trailers
-
-            trailers = []
-            for trailer in tmdb_data["videos"]["results"]:
-                if (
-                    trailer["type"] == "Trailer"
-                    and trailer["site"] == "YouTube"
-                    and trailer["iso_3166_1"] == "US"
-                ):
-                    trailers.append(trailer)
-
-            if trailers:
-                tmdb_data["trailer_url"] = (
-                    f"https://www.youtube.com/watch?v={max(trailers, key=lambda x: x['size'])['key']}"
-                )
-            else:
-                tmdb_data["trailer_url"] = None
-
-            # IMDB page
-            tmdb_data["imdb_url"] = (
-                f"https://www.imdb.com/title/{tmdb_data.get('imdb_id')}/"
-                if tmdb_data.get("imdb_id")
-                else None
-            )
-
-            # Synopsis
-            tmdb_data["synopsis"] = tmdb_data.pop("overview", None)
+        """
+        Extract and format the desired TMDb fields into a new record, using
+        the compiled extractor for the media type.
+        """
+        extractor = self.extractors.get(media_type)
+        if extractor is None:
+            raise ValueError(f"Unsupported media type: {media_type}")
 
-            # Release Date
-            tmdb_data["release_date"] = tmdb_data.pop("release_date", None)
+        return MediaRecord(**extractor.extract(tmdb_data))
 
-            # Cast members
-            for member in tmdb_data["credits"]["cast"]:
-                if (
-                    member["known_for_department"] == "Acting"
-                    and "(uncredited)" not in member["character"]
-                ):
-                    tmdb_data.setdefault("cast_list", []).append(member["name"])
+    def get_changed_ids(self, media_type: str, start_date: date) -> Set[int]:
+        """
+        Return the IDs of every movie or TV show changed on TMDB since
+        start_date, walking the change feed in windows of up to 14 days.
+        """
+        if media_type not in ("movie", "tv"):
+            raise ValueError(f"Unsupported media type: {media_type}")
 
-            tmdb_data["cast"] = ", ".join(tmdb_data.pop("cast_list", [])[:10])
+        changed_ids = set()
+        window_start = start_date
+        today = date.today()
 
-            # Country of origin
-            # FIXME using the wrong data, should use "origin_country"
-            tmdb_data["country_of_origin"] = (
-                tmdb_data.get("production_countries")[0]["name"]
-                if tmdb_data.get("production_countries")
-                else None
+        while window_start <= today:
+            window_end = min(
+                window_start + timedelta(days=CHANGES_MAX_DAYS - 1), today
             )
+            page, total_pages = 1, 1
 
-            # Content rating
-            for result in tmdb_data["release_dates"]["results"]:
-                if result["iso_3166_1"] == "US":
-                    for date in result["release_dates"]:
-                        if date["certification"]:
-                            tmdb_data["content_rating"] = date["certification"]
-                        else:
-                            tmdb_data["content_rating"] = None
-
-            # Poster path
-            tmdb_data["poster_path"] = (
-                f'https://image.tmdb.org/t/p/original{tmdb_data["poster_path"]}'
-                if tmdb_data.get("poster_path")
-                else None
-            )
-
-            # # Episode count
-            # tmdb_data['episodes'] = tmdb_data.pop('number_of_episodes', None)
-
-            # # Season count
-            # tmdb_data['seasons'] = tmdb_data.pop('number_of_seasons', None)
+            while page <= total_pages:
+                response = self.api.get_changes(
+                    media_type, window_start.isoformat(), window_end.isoformat(), page
+                )
+                changed_ids.update(item["id"] for item in response.get("results", []))
+                total_pages = response.get("total_pages", 1)
+                page += 1
 
-            # Writer
-            # "Writer": {"rich_text": [{"text": {"content": data.get("writer")}}]},
+            window_start = window_end + timedelta(days=1)
 
-            # Last episode
-            # "Last Episode": {"rich_text": [{"text": {"content": data.get("last_episode")}}]},
+        logger.info(
+            "Found %d changed %s ID(s) since %s", len(changed_ids), media_type, start_date
+        )
+        return changed_ids
 
-            # Upcoming episode
-            # "Upcoming Episode": {"rich_text": [{"text": {"content": data.get("upcoming_episode")}}]},
+    def resolve_title(self, title: str) -> Dict[str, Any]:
+        """
+        Return the search result to use for a title (see _resolve_title).
+        Identical titles, ignoring case and whitespace, share one resolution.
+        """
+        if not self.dedupe:
+            return self._resolve_title(title)
+        return self._resolved.do(self.title_key(title), self._resolve_title, title)
 
-            # Last air date
-            # "Last Air Date": {"date": {"start": data.get("last_air_date")}},
+    def _resolve_title(self, title: str) -> Dict[str, Any]:
+        """
+        Search for a title and return the search result to use for it.
+
+        Title markers (e.g. "Parasite[m2019") narrow the search to one media
+        type and year. Results are ranked locally and the best one is only
+        returned if it matches confidently, so no details are fetched for a
+        likely wrong match.
+
+        With a title index, a clear index match (see TitleIndex.resolve) is
+        used without searching. The exports it is built from carry no years,
+        so titles with a year marker are always searched. Otherwise works
+        whose original title matches are added to the search results as
+        candidates, so an exact match the first page of results left out can
+        still be picked, and are ranked like any other result.
+        """
+        query = parse_title(title)
 
-            # Next air date
-            # "Next Air Date": {"date": {"start": data.get("next_air_date")}},
+        if self.title_index is not None and query.year is None:
+            match = self.title_index.resolve(query.title, query.media_type)
+            if match is not None:
+                logger.debug("Title index hit for '%s': %s", title, match)
+                return match._asdict()
 
-            # Production status
-            tmdb_data["status"] = tmdb_data.pop("status", None)
+        search_results = self.search_media(query.title, query.media_type, query.year)
 
-            # Original language
-            # FIXME use tmdb's internal languages instead
-            # tmdb_data['original_language'] = iso_639_1_languages[tmdb_data.get('original_language', '')]
+        # The year filter is strict; let the ranker weigh the year instead
+        if not search_results and query.year and query.media_type:
+            search_results = self.search_media(query.title, query.media_type)
 
-            # Original title
-            tmdb_data["original_title"] = (
-                tmdb_data.get("original_title")
-                if tmdb_data.get("original_title", "") != tmdb_data.get("title")
-                else None
+        if self.title_index is not None:
+            search_results = search_results + self._index_candidates(
+                query, search_results
             )
 
-            # Backdrop path
-            tmdb_data["backdrop_path"] = (
-                f'https://image.tmdb.org/t/p/original{tmdb_data["backdrop_path"]}'
+        if not search_results:
+            raise ValueError("No TMDb results found for the title.")
+
+        best, confident = self.ranker.best(query, search_results)
+        if best is None:
+            raise ValueError("No movie or TV results found for the title.")
+        if not confident:
+            name = best.result.get("title") or best.result.get("name")
+            raise LowConfidenceMatchException(
+                f"No confident match for '{title}' "
+                f"(best was '{name}' with score {best.score:.2f})"
             )
 
-        elif media_type == "tv":
-            pass
-
-        for key in list(tmdb_data.keys()):
-            if tmdb_data[key] is None or key not in [
-                "title",
-                "type",
-                "tagline",
-                "tmdb_rating",
-                "directors",
-                "producers",
-                "genres",
-                "runtime",
-                "streaming",
-                "watch_free",
-                "trailer_url",
-                "imdb_url",
-                "synopsis",
-                "release_date",
-                "cast",
-                "country_of_origin",
-                "content_rating",
-                "poster_path",
-                "status",
-                "original_language",
-                "original_title",
-                "backdrop_path",
-            ]:
-                del tmdb_data[key]
-
-        return tmdb_data
+        return best.result
+
+    def _index_candidates(
+        self, query: TitleQuery, search_results: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Title index matches missing from the search results, as search results."""
+        found = {
+            (result.get("media_type"), result.get("id")) for result in search_results
+        }
+        title_key = {"movie": "original_title", "tv": "original_name"}
+        return [
+            {
+                "media_type": match.media_type,
+                "id": match.id,
+                # Exports carry no dates, so a requested year never matches these
+                title_key[match.media_type]: query.title,
+                "popularity": match.popularity,
+            }
+            for match in self.title_index.lookup(query.title, query.media_type)[
+                :INDEX_CANDIDATES
+            ]
+            if (match.media_type, match.id) not in found
+        ]
 
     def get_cleaned_media_data(self, title: str):
         """
         Searches for media by title and returns cleaned data of the first result.
         """
-        search_results = self.search_media(title)
-
-        if not search_results:
-            raise ValueError("No TMDb results found for the title.")
-
-        # Use the first result for now; a GUI could allow selection from search_results.
-        tmdb_result = search_results[0]
-        media_type = tmdb_result.get("media_type")
-
-        # Fetch detailed data and clean it
-        raw_data = self.fetch_media_details(tmdb_result)
-        cleaned_data = self.clean_media_data(raw_data, media_type)
-
-        print(search_results)
-
-        # return cleaned_data
+        tmdb_result = self.resolve_title(title)
+        return self.fetch_cleaned(tmdb_result)
@@ -1,55 +1,176 @@
 import logging
+import random
+import time
+from typing import Any, Dict, Iterable
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from .Metrics import (
+    TMDB_RATE_LIMITED,
+    TMDB_REQUEST_SECONDS,
+    TMDB_REQUESTS,
+    TMDB_RETRIES,
+    endpoint_label,
+)
+from .RateLimiter import RateLimiter
 
 # Configure the logger for TMDBAPI
 logger = logging.getLogger(__name__)
 
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 
 class TMDB_API:
     BASE_URL = "https://api.themoviedb.org/3/"
 
-    def __init__(self, api_key):
+    def __init__(
+        self,
+        api_key,
+        base_url: str | None = None,
+        timeout: float | tuple = (3.05, 15),
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        pool_size: int = 16,
+        limiter: RateLimiter | None = None,
+    ):
+        """
+        :param api_key: A v4 read access token (sent as a bearer token) or a
+            v3 API key (sent as the api_key query parameter).
+        :param base_url: Override BASE_URL, e.g. to point at a local stand-in.
+        :param timeout: Connect and read timeouts in seconds, per attempt.
+        :param max_retries: Retries after the first attempt of a request.
+        :param backoff: Base delay of the exponential retry backoff.
+        :param max_backoff: Longest delay between two attempts.
+        :param pool_size: Keep-alive connections kept open to TMDb.
+        :param limiter: Token bucket every request waits on, shared with other
+            processes calling TMDb.
+        """
         self.api_key = api_key
-        # Authenticate API key
-        if not self._authenticate():
-            raise ValueError("Invalid TMDb API key. Authentication failed.")
+        self.base_url = base_url or self.BASE_URL
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = limiter
 
-    def _authenticate(self):
+        # One session reuses connections across every request and thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["accept"] = "application/json"
+
+        # v4 read access tokens are JWTs; anything else is a v3 key
+        self._auth_params: Dict[str, str] = {}
+        if api_key and "." in api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        elif api_key:
+            self._auth_params["api_key"] = api_key
+
+    def authenticate(self):
         """
         Check if the provided API key is valid by requesting a new token.
         """
         try:
-            url = self.BASE_URL + "authentication"
-            headers = {
-                "accept": "application/json",
-                "Authorization": f"Bearer {self.api_key}",
-            }
-            response = requests.get(url=url, headers=headers)
-            response.raise_for_status()  # Will raise an HTTPError if the request failed
-            if response.json().get("success"):
+            if self._get("authentication").get("success"):
                 logger.info("API key authentication successful.")
                 return True
             else:
                 logger.error("API key authentication failed. Check API key.")
                 return False
         except requests.exceptions.HTTPError as http_err:
-            logger.error(f"HTTP error during authentication: {http_err}", exc_info=True)
+            logger.error("HTTP error during authentication: %s", http_err, exc_info=True)
             return False
         except Exception as err:
-            logger.error(f"Error during API key authentication: {err}", exc_info=True)
+            logger.error("Error during API key authentication: %s", err, exc_info=True)
             return False
 
-    def _get(self, endpoint, headers=None):
+    def _retry_delay(self, attempt: int, response=None) -> float:
+        """
+        Seconds to wait before the next attempt: the server's Retry-After when
+        it sends one, otherwise exponential backoff with full jitter. Jitter is
+        added to Retry-After too, so clients told the same time don't all
+        come back at once. Only the backoff is capped at max_backoff; a longer
+        Retry-After is always waited out in full.
+        """
+        backoff = min(self.max_backoff, self.backoff * 2**attempt)
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, backoff)
+        return random.uniform(0, backoff)
+
+    @staticmethod
+    def _retry_after(response) -> float | None:
+        """The response's Retry-After in seconds, if it sent a usable one."""
+        if response is None or not response.headers.get("Retry-After"):
+            return None
+        try:
+            return float(response.headers["Retry-After"])
+        except ValueError:
+            return None
+
+    def _get(self, endpoint, params=None) -> Dict[str, Any]:
         """Helper method for making GET requests to the TMDb API."""
-        url = f"{self.BASE_URL}/{endpoint}"
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        if headers is None:
-            headers = {}
-        headers["accept"] = "application/json"
-        headers["Authorization"] = (
-            f"Bearer {self.api_key}"  # Append the API key to each request
-        )
+        url = f"{self.base_url.rstrip('/')}/{endpoint}"
+        params = {**self._auth_params, **(params or {})}
+        label = endpoint_label(endpoint)
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            if self.limiter:
+                self.limiter.acquire()
+            try:
+                with TMDB_REQUEST_SECONDS.time(endpoint=label):
+                    response = self.session.get(
+                        url, params=params, timeout=self.timeout
+                    )
+                TMDB_REQUESTS.inc(endpoint=label, status=str(response.status_code))
+                if self.limiter:
+                    self.limiter.observe(response.headers)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+                reason = str(response.status_code)
+                if response.status_code == 429:
+                    TMDB_RATE_LIMITED.inc(endpoint=label)
+                    if self.limiter:
+                        self.limiter.penalize(self._retry_after(response))
+            except (requests.ConnectionError, requests.Timeout) as err:
+                TMDB_REQUESTS.inc(endpoint=label, status="error")
+                error = str(err)
+                reason = type(err).__name__
+
+            if attempt == self.max_retries:
+                break
+
+            TMDB_RETRIES.inc(endpoint=label, reason=reason)
+            delay = self._retry_delay(attempt, response)
+            logger.warning(
+                "Retrying %s in %.2fs after %s (attempt %d of %d)",
+                endpoint,
+                delay,
+                error,
+                attempt + 1,
+                self.max_retries,
+            )
+            time.sleep(delay)
+
+        if response is not None:
+            response.raise_for_status()
+        raise requests.ConnectionError(f"Giving up on {endpoint}: {error}")
+
+    def search(self, kind, query, **params) -> Dict[str, Any]:
+        """
+        Run a search/multi, search/movie or search/tv query.
+        :return: The full response, including paging information.
+        """
+        return self._get(f"search/{kind}", params={"query": query, **params})
 
     def search_multi(self, title):
         """
@@ -57,8 +178,20 @@ class TMDB_API:
         :param title: The title of the movie or TV show.
         :return: List of search results.
         """
-        params = {"query": title}
-        return self._get("search/multi", params=params).get("results", [])
+        return self.search("multi", title).get("results", [])
+
+    def get_details(self, media_type, media_id, append_to_response: Iterable[str] = ()):
+        """
+        Get detailed information for a movie or TV show.
+        :param media_type: "movie" or "tv".
+        :param media_id: The TMDb ID of the movie or TV show.
+        :param append_to_response: Sub-resources to include in the response.
+        :return: Dictionary of details.
+        """
+        params = {}
+        if append_to_response:
+            params["append_to_response"] = ",".join(append_to_response)
+        return self._get(f"{media_type}/{media_id}", params=params)
 
     def get_movie_details(self, movie_id):
         """
@@ -66,7 +199,7 @@ class TMDB_API:
         :param movie_id: The TMDb ID of the movie.
         :return: Dictionary of movie details.
         """
-        return self._get(f"movie/{movie_id}")
+        return self.get_details("movie", movie_id)
 
     def get_tv_details(self, tv_id):
         """
@@ -74,4 +207,42 @@ class TMDB_API:
         :param tv_id: The TMDb ID of the TV show.
         :return: Dictionary of TV show details.
         """
-        return self._get(f"tv/{tv_id}")
+        return self.get_details("tv", tv_id)
+
+    def get_changes(self, media_type, start_date, end_date, page=1):
+        """
+        Get one page of the movie or TV change feed.
+        :param media_type: "movie" or "tv".
+        :param start_date: First day (YYYY-MM-DD) of the range, at most 14 days long.
+        :param end_date: Last day (YYYY-MM-DD) of the range.
+        :return: Dictionary with the changed IDs and paging information.
+        """
+        return self._get(
+            f"{media_type}/changes",
+            params={"start_date": start_date, "end_date": end_date, "page": page},
+        )
+
+    def get_configuration(self, table=None):
+        """
+        Get TMDb's API configuration or one of its reference lists.
+        :param table: None for the image configuration, or "languages",
+            "countries", "jobs", ...
+        :return: The configuration dictionary or the list.
+        """
+        return self._get(f"configuration/{table}" if table else "configuration")
+
+    def get_genres(self, media_type):
+        """
+        Get the list of movie or TV genres.
+        :param media_type: "movie" or "tv".
+        :return: Dictionary with the list of genres.
+        """
+        return self._get(f"genre/{media_type}/list")
+
+    def get_watch_providers(self, media_type):
+        """
+        Get the list of movie or TV watch providers.
+        :param media_type: "movie" or "tv".
+        :return: Dictionary with the list of providers.
+        """
+        return self._get(f"watch/providers/{media_type}")
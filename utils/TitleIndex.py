@@ -0,0 +1,295 @@
+import gzip
+import heapq
+import io
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+import requests
+
+from .SearchRanker import normalize_title
+
+logger = logging.getLogger(__name__)
+
+EXPORT_URL = "http://files.tmdb.org/p/exports/{name}_ids_{day:%m_%d_%Y}.json.gz"
+EXPORT_NAMES = {"movie": "movie", "tv": "tv_series"}
+EXPORT_TITLE_KEYS = {"movie": "original_title", "tv": "original_name"}
+
+# File layout: header, fixed-size records sorted by (title, -popularity), titles
+MAGIC = b"TIX1"
+HEADER = struct.Struct("<4sI")  # magic, record count
+RECORD = struct.Struct("<IHxxIf")  # title offset, title length, TMDB ID, popularity
+
+# Sorted runs written while building: title length, then popularity and ID
+RUN_ENTRY = struct.Struct("<HfI")
+
+
+class IndexMatch(NamedTuple):
+    media_type: str
+    id: int
+    popularity: float
+
+
+class _Segment:
+    """
+    A memory-mapped index file for one media type. The mapping and file are
+    closed by close(), or when the segment is garbage collected.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a title index: {path}")
+        self._records_start = HEADER.size
+        self._titles_start = HEADER.size + self.count * RECORD.size
+
+    def _record(self, index: int) -> Tuple[bytes, int, float]:
+        offset, length, tmdb_id, popularity = RECORD.unpack_from(
+            self._map, self._records_start + index * RECORD.size
+        )
+        start = self._titles_start + offset
+        return self._map[start : start + length], tmdb_id, popularity
+
+    def lookup(self, key: bytes) -> List[Tuple[int, float]]:
+        """Return (ID, popularity) of every record with the key, most popular first."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        matches = []
+        while low < self.count:
+            title, tmdb_id, popularity = self._record(low)
+            if title != key:
+                break
+            matches.append((tmdb_id, popularity))
+            low += 1
+        return matches
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+
+class TitleIndex:
+    """
+    Local title-to-ID index built from TMDB's daily ID export files.
+
+    Each media type has its own memory-mapped index file of normalized
+    original titles, sorted so a lookup is a binary search with no network
+    call. A daily refresh only downloads and rebuilds the media types whose
+    export is newer than the one already indexed.
+
+    The exports only carry original titles, so a match says nothing about
+    better-known works released under that title elsewhere (e.g. "Parasite"
+    is the original title of a 1982 film, not of the 2019 one). A match is
+    therefore only used on its own when it is popular in its own right and
+    clearly ahead of any other work with the title; otherwise it is left to
+    be ranked alongside search results.
+    """
+
+    def __init__(
+        self,
+        directory: str = "cache/title_index",
+        min_popularity: float = 0.0,
+        session: requests.Session | None = None,
+        run_size: int = 500_000,
+        hit_popularity: float = 10.0,
+        dominance: float = 5.0,
+    ) -> None:
+        """
+        :param min_popularity: Leave out titles less popular than this.
+        :param run_size: Export entries sorted in memory at once while building.
+        :param hit_popularity: Least popularity of a match used without a search.
+        :param dominance: How many times more popular that match must be than
+            the next one with the same title.
+        """
+        self.directory = directory
+        self.min_popularity = min_popularity
+        self.hit_popularity = hit_popularity
+        self.dominance = dominance
+        self.run_size = run_size
+        self.session = session or requests.Session()
+        self._segments: Dict[str, _Segment] = {}
+        os.makedirs(directory, exist_ok=True)
+        self.meta = self._load_meta()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_meta(self) -> Dict[str, str]:
+        if not os.path.exists(self._path("meta.json")):
+            return {}
+        with open(self._path("meta.json"), "r") as json_file:
+            return json.load(json_file)
+
+    def _segment(self, media_type: str) -> _Segment | None:
+        """Open a media type's index on first use."""
+        if media_type not in self._segments:
+            path = self._path(f"{media_type}.idx")
+            if not os.path.exists(path):
+                return None
+            self._segments[media_type] = _Segment(path)
+        return self._segments[media_type]
+
+    def lookup(self, title: str, media_type: str | None = None) -> List[IndexMatch]:
+        """Return every indexed movie and/or TV show with the title, most popular first."""
+        key = normalize_title(title).encode()
+        matches = []
+        for indexed_type in (media_type,) if media_type else ("movie", "tv"):
+            segment = self._segment(indexed_type)
+            if segment is not None:
+                matches.extend(
+                    IndexMatch(indexed_type, tmdb_id, popularity)
+                    for tmdb_id, popularity in segment.lookup(key)
+                )
+        matches.sort(key=lambda match: match.popularity, reverse=True)
+        return matches
+
+    def resolve(self, title: str, media_type: str | None = None) -> IndexMatch | None:
+        """
+        Return the match to use for a title without searching, or None when
+        there is no match or no clear one (left to search and ranking).
+        """
+        matches = self.lookup(title, media_type)
+        if not matches or matches[0].popularity < self.hit_popularity:
+            return None
+        if len(matches) > 1 and matches[0].popularity < (
+            matches[1].popularity * self.dominance
+        ):
+            return None
+        return matches[0]
+
+    def refresh(self, today: date | None = None) -> List[str]:
+        """
+        Rebuild the index of each media type whose daily export is newer
+        than the indexed one. Returns the media types that were rebuilt.
+        """
+        # Exports are published during the morning (UTC); use yesterday's until then
+        today = today or datetime.now(timezone.utc).date()
+        rebuilt = []
+
+        for media_type in EXPORT_NAMES:
+            for day in (today, today - timedelta(days=1)):
+                if self.meta.get(media_type, "") >= day.isoformat():
+                    break
+                url = EXPORT_URL.format(name=EXPORT_NAMES[media_type], day=day)
+                response = self.session.get(url, stream=True, timeout=(5, 60))
+                if response.status_code in (403, 404):
+                    response.close()
+                    continue
+                response.raise_for_status()
+
+                with response, gzip.GzipFile(fileobj=response.raw) as export:
+                    count = self.build(media_type, io.TextIOWrapper(export, "utf-8"))
+                self.meta[media_type] = day.isoformat()
+                self._save_meta()
+                rebuilt.append(media_type)
+                logger.info("Indexed %d %s title(s) from %s", count, media_type, url)
+                break
+
+        return rebuilt
+
+    def _save_meta(self) -> None:
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w") as json_file:
+            json.dump(self.meta, json_file)
+        os.replace(tmp_path, self._path("meta.json"))
+
+    def _entries(self, media_type: str, lines: Iterable[str]) -> Iterator[Tuple]:
+        title_key = EXPORT_TITLE_KEYS[media_type]
+        for line in lines:
+            item = json.loads(line)
+            popularity = item.get("popularity") or 0.0
+            if item.get("adult") or item.get("video") or popularity < self.min_popularity:
+                continue
+            key = normalize_title(item.get(title_key) or "").encode()
+            if key:
+                yield key, -popularity, item["id"]
+
+    def build(self, media_type: str, lines: Iterable[str]) -> int:
+        """
+        Build a media type's index from export lines and swap it in atomically.
+
+        The export is sorted in runs of run_size entries, each spilled to a
+        temporary file, and the runs are merged straight into the index, so
+        memory use doesn't grow with the size of the export.
+        """
+        path = self._path(f"{media_type}.idx")
+        tmp_path = f"{path}.tmp"
+        count = 0
+
+        with tempfile.TemporaryDirectory(dir=self.directory) as work_dir:
+            runs = self._write_runs(self._entries(media_type, lines), work_dir)
+            titles_path = os.path.join(work_dir, "titles")
+
+            with open(tmp_path, "wb") as index_file, open(titles_path, "w+b") as titles:
+                index_file.write(HEADER.pack(MAGIC, 0))
+                # Equal titles are adjacent once sorted and stored once
+                previous, offset = None, 0
+                for key, negative_popularity, tmdb_id in heapq.merge(
+                    *(self._read_run(run) for run in runs)
+                ):
+                    if key != previous:
+                        offset = titles.tell()
+                        titles.write(key)
+                        previous = key
+                    index_file.write(
+                        RECORD.pack(
+                            offset, min(len(key), 0xFFFF), tmdb_id, -negative_popularity
+                        )
+                    )
+                    count += 1
+
+                titles.seek(0)
+                shutil.copyfileobj(titles, index_file)
+                index_file.seek(0)
+                index_file.write(HEADER.pack(MAGIC, count))
+
+        # The next lookup opens the new file. Lookups already running hold the
+        # old segment, whose mapping outlives the replaced file and is closed
+        # when the last of them drops it, so it isn't closed here.
+        os.replace(tmp_path, path)
+        self._segments.pop(media_type, None)
+        return count
+
+    def _write_runs(self, entries: Iterator[Tuple], work_dir: str) -> List[str]:
+        """Sort entries in runs of run_size and write each run to a file."""
+        runs = []
+        while True:
+            run = [entry for _, entry in zip(range(self.run_size), entries)]
+            if not run:
+                return runs
+            run.sort()
+            run_path = os.path.join(work_dir, f"run{len(runs)}")
+            with open(run_path, "wb") as run_file:
+                for key, negative_popularity, tmdb_id in run:
+                    run_file.write(RUN_ENTRY.pack(len(key), -negative_popularity, tmdb_id))
+                    run_file.write(key)
+            runs.append(run_path)
+
+    @staticmethod
+    def _read_run(run_path: str) -> Iterator[Tuple[bytes, float, int]]:
+        with open(run_path, "rb") as run_file:
+            while True:
+                header = run_file.read(RUN_ENTRY.size)
+                if not header:
+                    return
+                length, popularity, tmdb_id = RUN_ENTRY.unpack(header)
+                yield run_file.read(length), -popularity, tmdb_id
+
+    def close(self) -> None:
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
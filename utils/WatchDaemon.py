@@ -0,0 +1,254 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+from .IncrementalRefresh import IncrementalRefresh
+from .SyncState import SyncState
+from .TMDBHandler import TMDBHandler
+from .WorkScheduler import LOOKUP, NEW, WorkScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class WatchDaemon:
+    """
+    Poll Notion for new entries and enrich them as soon as they appear.
+
+    Each poll only asks for entries edited at or after the high-water mark,
+    the latest last_edited_time seen so far, which is kept in the sync state
+    across restarts. Notion rounds edit times to the minute, so entries at
+    the mark are remembered and not enriched twice. The interval drops to
+    the minimum as soon as a poll enriches something and grows while the
+    database is idle.
+
+    An entry whose enrichment or write fails holds the mark and is retried
+    after max_interval seconds, doubling with every failure, until it has
+    failed max_attempts times; it is then left alone until it is edited
+    again.
+
+    With a scheduler, entries are enriched on its workers: pages never
+    synced before as new entries, and pages already linked to TMDB, whose
+    titles someone marked again, as lookups. A refresh of linked pages can
+    run every refresh_interval seconds as background work on the same
+    scheduler, so new entries don't wait behind it.
+    """
+
+    def __init__(
+        self,
+        notion_handler,
+        tmdb_handler: TMDBHandler,
+        state: SyncState,
+        min_interval: float = 2.0,
+        max_interval: float = 15.0,
+        backoff: float = 1.5,
+        scheduler: WorkScheduler | None = None,
+        refresh_interval: float | None = None,
+        max_attempts: int = 5,
+    ) -> None:
+        """
+        :param scheduler: Where entries and refreshes are run; needed for
+            refresh_interval.
+        :param refresh_interval: Seconds between background refreshes.
+        :param max_attempts: Failures after which an entry is given up on.
+        """
+        if refresh_interval and scheduler is None:
+            raise ValueError("A background refresh needs a scheduler")
+        self.notion_handler = notion_handler
+        self.tmdb_handler = tmdb_handler
+        self.state = state
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.scheduler = scheduler
+        self.refresh_interval = refresh_interval
+        self.max_attempts = max_attempts
+        self._refresh_thread: threading.Thread | None = None
+        self._last_refresh: float | None = None
+        # Page ID -> last_edited_time of entries handled at the current mark
+        self._seen: Dict[str, str] = {}
+        # Page ID -> (last_edited_time, failures, monotonic time of next try)
+        self._retries: Dict[str, Tuple[str, int, float]] = {}
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """Poll until the stop event is set."""
+        stop = stop or threading.Event()
+        logger.info("Watching for new entries since %s", self.state.edited_mark)
+
+        while not stop.is_set():
+            self._maybe_refresh()
+            try:
+                found = self.poll_once()
+            except Exception as e:
+                # Network trouble shouldn't end the daemon; back off and retry
+                logger.exception("Poll failed: %s", e)
+                found = 0
+
+            if found:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.max_interval, self.interval * self.backoff)
+            stop.wait(self.interval)
+
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+
+    def poll_once(self) -> int:
+        """Enrich entries edited since the mark. Returns how many were enriched."""
+        mark = self.state.edited_mark
+        now = time.monotonic()
+        # Entries with the future of their enrichment, or its error when inline
+        polled: List[Tuple[Dict[str, Any], Any]] = []
+        # Edit times of failed entries still to be retried, which hold the mark
+        held: List[str] = []
+        retries = {}
+        # Titles seen in earlier polls are looked up afresh
+        self.tmdb_handler.reset_dedupe()
+
+        for entry in self.notion_handler.iter_entries_to_update(edited_since=mark):
+            page_id, edited = entry["id"], entry["last_edited_time"]
+            if self._seen.get(page_id) == edited:
+                continue
+
+            retry = self._retries.get(page_id)
+            if retry is not None and retry[0] == edited:
+                retries[page_id] = retry
+                if retry[2] > now:
+                    held.append(edited)
+                    continue
+
+            if self.scheduler is None:
+                polled.append((entry, self._attempt(entry)))
+            else:
+                work_class = LOOKUP if page_id in self.state.links else NEW
+                future = self.scheduler.submit(work_class, self._enrich, entry)
+                polled.append((entry, future))
+
+        # Retries of entries no longer listed, or edited since, are dropped
+        self._retries = retries
+        if not polled:
+            return 0
+
+        failed = set()
+        for entry, outcome in polled:
+            error = outcome.exception() if isinstance(outcome, Future) else outcome
+            if error is not None:
+                logger.error("Enriching page %s failed: %s", entry["id"], error)
+                failed.add(entry["id"])
+        # Only this poll's pages: a background refresh flushes its own
+        pages = [entry["id"] for entry, _ in polled]
+        for write_result in self.notion_handler.flush_updates(pages).values():
+            if not write_result.success:
+                logger.error(
+                    "Writing page %s failed: %s",
+                    write_result.page_id,
+                    write_result.error,
+                )
+                failed.add(write_result.page_id)
+
+        handled = []
+        for entry, _ in polled:
+            page_id, edited = entry["id"], entry["last_edited_time"]
+            if page_id not in failed:
+                self._retries.pop(page_id, None)
+                handled.append(entry)
+                continue
+            failures = self._retries.get(page_id, (edited, 0, now))[1] + 1
+            if failures >= self.max_attempts:
+                logger.error(
+                    "Giving up on page %s after %d failures until it is edited again",
+                    page_id,
+                    failures,
+                )
+                self._retries.pop(page_id, None)
+                handled.append(entry)
+                continue
+            delay = self.max_interval * 2 ** (failures - 1)
+            self._retries[page_id] = (edited, failures, now + delay)
+            held.append(edited)
+
+        # The mark stops at the oldest entry still to be retried
+        if held:
+            newest = min(held)
+        else:
+            newest = max(
+                [entry["last_edited_time"] for entry in handled]
+                + list(self._seen.values())
+            )
+        if mark is None or newest > mark:
+            mark = newest
+        self._seen = {
+            page_id: seen_edited
+            for page_id, seen_edited in self._seen.items()
+            if seen_edited >= mark
+        }
+        for entry in handled:
+            if entry["last_edited_time"] >= mark:
+                self._seen[entry["id"]] = entry["last_edited_time"]
+
+        self.state.edited_mark = mark
+        self.state.save()
+        enriched = sum(entry["id"] not in failed for entry, _ in polled)
+        logger.info(
+            "Enriched %d new entries (%d failed), mark now %s",
+            enriched,
+            len(polled) - enriched,
+            mark,
+        )
+        return enriched
+
+    def _attempt(self, entry: Dict[str, Any]) -> Exception | None:
+        """Enrich an entry inline, returning its error instead of raising it."""
+        try:
+            self._enrich(entry)
+        except Exception as e:
+            return e
+        return None
+
+    def _maybe_refresh(self) -> None:
+        """Start a background refresh if one is due and none is running."""
+        if not self.refresh_interval:
+            return
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        now = time.monotonic()
+        last = self._last_refresh
+        if last is not None and now - last < self.refresh_interval:
+            return
+
+        self._last_refresh = now
+        refresh = IncrementalRefresh(
+            self.notion_handler,
+            self.tmdb_handler,
+            self.state,
+            scheduler=self.scheduler,
+            # Pages still queued when the next refresh is due are left to it
+            deadline=self.refresh_interval,
+        )
+        self._refresh_thread = threading.Thread(
+            target=self._run_refresh, args=(refresh,), name="watch-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def _run_refresh(self, refresh: IncrementalRefresh) -> None:
+        try:
+            refreshed = refresh.run()
+            logger.info("Background refresh done: %s", refreshed)
+        except Exception as e:
+            logger.exception("Background refresh failed: %s", e)
+
+    def _enrich(self, entry: Dict[str, Any]) -> None:
+        title = entry["properties"]["Title"]["title"][0]["plain_text"].rstrip(";")
+        page_id = entry["id"]
+
+        try:
+            tmdb_result = self.tmdb_handler.resolve_title(title)
+            cleaned_data = self.tmdb_handler.fetch_cleaned(tmdb_result)
+        except ValueError as e:
+            logger.error("%s: %s", title, e)
+            return
+
+        self.notion_handler.queue_update(page_id, cleaned_data, marked=True)
+        self.state.link(page_id, tmdb_result)
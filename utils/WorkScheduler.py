@@ -0,0 +1,181 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+from results_exceptions import DeadlineExceededException
+
+from .Metrics import SCHEDULER_EXPIRED, SCHEDULER_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Work classes, most urgent first
+NEW = "new"
+LOOKUP = "lookup"
+REFRESH = "refresh"
+WORK_CLASSES = (NEW, LOOKUP, REFRESH)
+
+DEFAULT_SHARES = {NEW: 0.6, LOOKUP: 0.3, REFRESH: 0.1}
+
+
+class _Item:
+    __slots__ = ("func", "args", "future", "deadline", "queued_at")
+
+    def __init__(self, func, args, deadline: float | None) -> None:
+        self.func = func
+        self.args = args
+        self.future: Future = Future()
+        self.deadline = deadline
+        self.queued_at = time.monotonic()
+
+
+class WorkScheduler:
+    """
+    Priority scheduler for enrichment work shared by several kinds of work.
+
+    Items are queued per class: new entries, user-triggered lookups and
+    background refresh. Whenever a worker is free it takes the next item of
+    the class using the least of its share, so each class gets its share of
+    the workers while it has work queued and idle capacity goes to whoever
+    has some. Ties go to the more urgent class. Refresh work never takes the
+    last reserve workers, so a new entry can start as soon as it arrives
+    even while a full refresh is running.
+
+    Within a class, items with a deadline go first, earliest deadline first,
+    then the rest in order. An item still queued at its deadline is dropped
+    and its future fails with DeadlineExceededException.
+    """
+
+    def __init__(
+        self,
+        workers: int = 8,
+        shares: Dict[str, float] | None = None,
+        reserve: int = 1,
+    ) -> None:
+        """
+        :param workers: Items run at once across all classes.
+        :param shares: Relative share of the workers per class, see DEFAULT_SHARES.
+        :param reserve: Workers refresh work leaves free for the other classes.
+        """
+        self.workers = workers
+        self.shares = {**DEFAULT_SHARES, **(shares or {})}
+        self.limits = {work_class: workers for work_class in WORK_CLASSES}
+        self.limits[REFRESH] = max(1, workers - reserve)
+
+        self._queues: Dict[str, List[Tuple[float, int, _Item]]] = {
+            work_class: [] for work_class in WORK_CLASSES
+        }
+        self._running = {work_class: 0 for work_class in WORK_CLASSES}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self,
+        work_class: str,
+        func: Callable[..., Any],
+        *args,
+        deadline: float | None = None,
+    ) -> Future:
+        """
+        Queue func(*args) under a work class and return a future of its result.
+
+        :param deadline: Seconds from now by which the item must have started.
+        """
+        if work_class not in self._queues:
+            raise ValueError(f"Unknown work class: {work_class}")
+
+        if deadline is not None:
+            deadline += time.monotonic()
+        item = _Item(func, args, deadline)
+        # Items with a deadline sort first, by deadline; the rest by arrival
+        key = item.deadline if item.deadline is not None else float("inf")
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            heapq.heappush(self._queues[work_class], (key, next(self._sequence), item))
+            self._condition.notify()
+        return item.future
+
+    def pending(self) -> Dict[str, int]:
+        """Queued items per class."""
+        with self._condition:
+            return {name: len(queue) for name, queue in self._queues.items()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop taking work; queued items still run unless wait is False."""
+        with self._condition:
+            self._closed = True
+            if not wait:
+                for queue in self._queues.values():
+                    for _, _, item in queue:
+                        item.future.cancel()
+                    queue.clear()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next(self) -> Tuple[str, _Item] | None:
+        """Pop the next item to run, dropping expired ones; None if none may run now."""
+        now = time.monotonic()
+        while True:
+            chosen = None
+            for work_class in WORK_CLASSES:
+                queue = self._queues[work_class]
+                if not queue or self._running[work_class] >= self.limits[work_class]:
+                    continue
+                usage = self._running[work_class] / self.shares[work_class]
+                if chosen is None or usage < chosen[0]:
+                    chosen = (usage, work_class)
+            if chosen is None:
+                return None
+
+            work_class = chosen[1]
+            _, _, item = heapq.heappop(self._queues[work_class])
+            if item.deadline is not None and item.deadline < now:
+                SCHEDULER_EXPIRED.inc(work_class=work_class)
+                item.future.set_exception(
+                    DeadlineExceededException(
+                        f"{work_class} item missed its deadline by "
+                        f"{now - item.deadline:.1f}s"
+                    )
+                )
+                continue
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            return work_class, item
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                picked = self._next()
+                while picked is None:
+                    if self._closed and not any(self._queues.values()):
+                        return
+                    self._condition.wait()
+                    picked = self._next()
+                work_class, item = picked
+                self._running[work_class] += 1
+
+            SCHEDULER_WAIT_SECONDS.observe(
+                time.monotonic() - item.queued_at, work_class=work_class
+            )
+            try:
+                item.future.set_result(item.func(*item.args))
+            except BaseException as e:
+                item.future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._running[work_class] -= 1
+                    # A freed slot may let another class start
+                    self._condition.notify_all()
@@ -1,5 +1,42 @@
+from .AsyncPipeline import AsyncPipeline
+from .IncrementalRefresh import IncrementalRefresh
+from .MediaRecord import MediaRecord
+from .Metrics import METRICS, MetricsRegistry
+from .MultiDatabaseSync import MultiDatabaseSync, load_shards
 from .NotionHandler import NotionHandler
+from .RateLimiter import RateLimiter
+from .RecordExporter import RecordExport, open_exporter
+from .PropertyEncoder import PropertyEncoder
+from .ReferenceData import ReferenceData
+from .RunJournal import RunJournal
+from .SyncState import SyncState
 from .TMDB_API import TMDB_API
+from .TMDBCache import TMDBCache
 from .TMDBHandler import TMDBHandler
+from .TitleIndex import TitleIndex
+from .WatchDaemon import WatchDaemon
+from .WorkScheduler import WorkScheduler
 
-__all__ = ["NotionHandler", "TMDBHandler", "TMDB_API"]
+__all__ = [
+    "AsyncPipeline",
+    "IncrementalRefresh",
+    "MediaRecord",
+    "METRICS",
+    "MetricsRegistry",
+    "MultiDatabaseSync",
+    "NotionHandler",
+    "PropertyEncoder",
+    "RateLimiter",
+    "RecordExport",
+    "ReferenceData",
+    "RunJournal",
+    "SyncState",
+    "TMDBHandler",
+    "TMDB_API",
+    "TMDBCache",
+    "TitleIndex",
+    "WatchDaemon",
+    "WorkScheduler",
+    "load_shards",
+    "open_exporter",
+]